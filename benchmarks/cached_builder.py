@@ -0,0 +1,57 @@
+"""
+Many threads requesting the same document at once, with and without a
+shared CachedBuilder.
+
+    python benchmarks/cached_builder.py [threads] [paths]
+
+Every thread waits on a barrier, then asks for the document once. Without
+the builder each thread runs its own build(); with it the concurrent
+requests are coalesced into a single build.
+"""
+
+import sys
+import threading
+import time
+
+import specs
+
+oas = specs.oas
+
+
+def run(threads, get):
+    barrier = threading.Barrier(threads + 1)
+    results = []
+
+    def worker():
+        barrier.wait()
+        results.append(get())
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for worker_thread in workers:
+        worker_thread.start()
+    start = time.perf_counter()
+    barrier.wait()
+    for worker_thread in workers:
+        worker_thread.join()
+    return time.perf_counter() - start, results
+
+
+def main():
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    spec = specs.shared(n, 50)
+
+    elapsed, _ = run(threads, lambda: oas.build(spec, validate=False))
+    print("build()        %.3fs" % elapsed)
+
+    builder = oas.builder(spec, validate=False)
+    elapsed, results = run(threads, builder.get)
+    assert all(rv is results[0] for rv in results)
+    print("CachedBuilder  %.3fs" % elapsed)
+
+    elapsed, _ = run(threads, builder.get)
+    print("cached         %.3fs" % elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Time of `import build_openapispec` plus `openapispec("3.0.3")` in a fresh
+interpreter.
+
+    python benchmarks/import_time.py [--repeat 10] [--budget 0.05]
+
+Reports the median over the repeats and exits with status 1 when it exceeds
+the budget (in seconds). Also checks that neither the validator stack nor
+asyncio is imported until they are used.
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+CHECK = """
+import sys, time
+start = time.perf_counter()
+from build_openapispec import openapispec
+openapispec("3.0.3")
+elapsed = time.perf_counter() - start
+for name in ("openapi_spec_validator", "asyncio"):
+    assert name not in sys.modules, name + " imported"
+print(elapsed)
+"""
+
+
+def measure() -> float:
+    result = subprocess.run(
+        [sys.executable, "-c", CHECK], capture_output=True, text=True, check=True
+    )
+    return float(result.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--budget", type=float, default=0.05)
+    args = parser.parse_args()
+
+    # the first run may write bytecode caches
+    measure()
+    times = [measure() for _ in range(args.repeat)]
+    median = statistics.median(times)
+    print(
+        "openapispec()  median %.1fms  min %.1fms  budget %.1fms"
+        % (median * 1e3, min(times) * 1e3, args.budget * 1e3)
+    )
+    if median > args.budget:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
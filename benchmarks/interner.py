@@ -0,0 +1,55 @@
+"""
+Memory held by several resident builds of a mostly-static document, with
+and without an Interner.
+
+    python benchmarks/interner.py [builds] [paths]
+
+Each build changes one path; everything else is unchanged. Without the
+interner every build is a full copy, with it the unchanged subtrees are the
+same objects in all builds.
+"""
+
+import sys
+import time
+import tracemalloc
+
+import specs
+
+oas = specs.oas
+
+
+def measure(builds, spec, **options):
+    tracemalloc.start()
+    start = time.perf_counter()
+    resident = []
+    for i in range(builds):
+        spec["paths"]["/changed"] = oas.PathItemObject(
+            {
+                "get": oas.OperationObject(
+                    {"responses": {"200": oas.ResponseObject({"description": str(i)})}}
+                )
+            }
+        )
+        resident.append(oas.build(spec, validate=False, **options))
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, current, resident
+
+
+def main():
+    builds = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    n = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    spec = specs.shared(n, 50)
+
+    elapsed, size, _ = measure(builds, spec)
+    print("build()    %.3fs  %6.1f MiB" % (elapsed, size / 2**20))
+
+    interner = oas.Interner()
+    elapsed, size, resident = measure(builds, spec, interner=interner)
+    assert resident[0]["components"] is resident[-1]["components"]
+    print("Interner   %.3fs  %6.1f MiB" % (elapsed, size / 2**20))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Per-node construction time and memory of Schema objects.
+
+    python benchmarks/schema_nodes.py [nodes]
+
+Builds a flat list of small SchemaObjects (half of them with a description)
+and reports the time and traced memory per node for construction and for
+the first build.
+"""
+
+import gc
+import sys
+import time
+import tracemalloc
+
+from build_openapispec import openapispec
+
+oas = openapispec("3.0.3")
+
+
+def make_nodes(count: int):
+    return [
+        oas.SchemaObject(
+            {
+                "type": "string",
+                "description": "\n    Field %d\n\n    Some text.\n    " % i,
+                "nullable": False,
+            }
+            if i % 2
+            else {"type": "integer", "format": "int64", "readOnly": False}
+        )
+        for i in range(count)
+    ]
+
+
+def measure(count: int):
+    # tracemalloc slows allocation down, so memory is measured separately
+    gc.collect()
+    tracemalloc.start()
+    nodes = make_nodes(count)
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del nodes
+
+    gc.collect()
+    start = time.perf_counter()
+    nodes = make_nodes(count)
+    construct = time.perf_counter() - start
+
+    spec = oas.OpenAPIObject(
+        {
+            "info": oas.InfoObject({"title": "bench", "version": "1"}),
+            "paths": {},
+            "x-nodes": nodes,
+        }
+    )
+    start = time.perf_counter()
+    oas.build(spec, validate=False)
+    build = time.perf_counter() - start
+    return construct, memory, build
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    construct, memory, build = measure(count)
+    print("nodes=%d" % count)
+    print("construct  %.3fs  %.0fns/node" % (construct, construct / count * 1e9))
+    print("memory     %.1fMB  %.0fB/node" % (memory / 2**20, memory / count))
+    print("build      %.3fs  %.0fns/node" % (build, build / count * 1e9))
+
+
+if __name__ == "__main__":
+    main()
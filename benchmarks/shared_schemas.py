@@ -0,0 +1,70 @@
+"""
+Build time with many references to a fixed set of shared models.
+
+    python benchmarks/shared_schemas.py
+
+With every Schema node serialized once, build time should grow with the
+number of distinct nodes, not with references x subtree size.
+"""
+
+import time
+
+from build_openapispec import openapispec
+
+oas = openapispec("3.0.3")
+
+
+def make_spec(models: int, references: int):
+    shared = [
+        oas.SchemaObject(
+            {
+                "type": "object",
+                "properties": {
+                    "p%d" % j: oas.SchemaObject({"type": "string"}) for j in range(20)
+                },
+            },
+            key="Model%d" % i,
+        )
+        for i in range(models)
+    ]
+    anonymous = [
+        oas.SchemaObject({"type": "array", "items": model}) for model in shared
+    ]
+    paths = {}
+    for i in range(references):
+        paths["/r%d" % i] = oas.PathItemObject(
+            {
+                "get": oas.OperationObject(
+                    {
+                        "responses": {
+                            "200": oas.ResponseObject(
+                                {
+                                    "description": "OK",
+                                    "content": {
+                                        "application/json": oas.MediaTypeObject(
+                                            {"schema": anonymous[i % models]}
+                                        )
+                                    },
+                                }
+                            )
+                        }
+                    }
+                )
+            }
+        )
+    return oas.OpenAPIObject(
+        {"info": oas.InfoObject({"title": "bench", "version": "1"}), "paths": paths}
+    )
+
+
+def main():
+    for references in (1000, 2000, 4000, 8000):
+        spec = make_spec(200, references)
+        start = time.perf_counter()
+        oas.build(spec, validate=False)
+        elapsed = time.perf_counter() - start
+        print("references=%-6d %.3fs" % (references, elapsed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Parameterized generators of large synthetic documents for the benchmarks.
+
+Every generator returns a valid OpenAPIObject whose size is controlled by
+its arguments, so a case can be scaled up without changing its shape.
+"""
+
+from build_openapispec import openapispec
+
+oas = openapispec("3.0.3")
+
+
+def _document(paths):
+    return oas.OpenAPIObject(
+        {"info": oas.InfoObject({"title": "bench", "version": "1"}), "paths": paths}
+    )
+
+
+def _operation(schema, **fields):
+    return oas.OperationObject(
+        {
+            "responses": {
+                "200": oas.ResponseObject(
+                    {
+                        "description": "OK",
+                        "content": {
+                            "application/json": oas.MediaTypeObject({"schema": schema})
+                        },
+                    }
+                )
+            },
+            **fields,
+        }
+    )
+
+
+def _model(properties: int, **kwargs):
+    return oas.SchemaObject(
+        {
+            "type": "object",
+            "description": "\n    A model.\n\n    With a longer description.\n    ",
+            "properties": {
+                "p%d"
+                % i: oas.SchemaObject(
+                    {"type": "string"} if i % 2 else {"type": "integer"}
+                )
+                for i in range(properties)
+            },
+        },
+        **kwargs,
+    )
+
+
+def paths(n: int):
+    """N paths, each with its own parameters and inline response schema."""
+    return _document(
+        {
+            "/items%d/{id}"
+            % i: oas.PathItemObject(
+                {
+                    "get": _operation(
+                        _model(10),
+                        parameters=[
+                            oas.ParameterObject(
+                                {
+                                    "name": "id",
+                                    "in": "path",
+                                    "required": True,
+                                    "schema": oas.SchemaObject({"type": "integer"}),
+                                }
+                            )
+                        ],
+                    )
+                }
+            )
+            for i in range(n)
+        }
+    )
+
+
+def shared(n: int, m: int):
+    """N paths referencing M shared SchemaObjects."""
+    models = [_model(20, key="Model%d" % i) for i in range(m)]
+    return _document(
+        {
+            "/items%d"
+            % i: oas.PathItemObject(
+                {
+                    "get": _operation(
+                        oas.SchemaObject({"type": "array", "items": models[i % m]})
+                    )
+                }
+            )
+            for i in range(n)
+        }
+    )
+
+
+def deep(depth: int):
+    """A single schema nested depth levels deep."""
+    schema = oas.SchemaObject({"type": "string"})
+    for _ in range(depth):
+        schema = oas.SchemaObject({"type": "object", "properties": {"child": schema}})
+    return _document({"/": oas.PathItemObject({"get": _operation(schema)})})
+
+
+def wide(width: int):
+    """A single schema with width properties."""
+    return _document({"/": oas.PathItemObject({"get": _operation(_model(width))})})
+
+
+def security(n: int, schemes: int = 4):
+    """N operations, each requiring all of the given number of security schemes."""
+    objects = [
+        oas.SecuritySchemeObject(
+            {"type": "apiKey", "name": "X-Key-%d" % i, "in": "header"},
+            key="Key%d" % i,
+        )
+        for i in range(schemes)
+    ]
+    return _document(
+        {
+            "/items%d"
+            % i: oas.PathItemObject(
+                {
+                    "get": _operation(
+                        oas.SchemaObject({"type": "string"}),
+                        security=[
+                            oas.SecurityRequirementObject(scheme=scheme)
+                            for scheme in objects
+                        ],
+                    )
+                }
+            )
+            for i in range(n)
+        }
+    )
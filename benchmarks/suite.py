@@ -0,0 +1,161 @@
+"""
+Benchmark suite over the synthetic documents in specs.py.
+
+    python benchmarks/suite.py [--scale 1.0] [--repeat 3] [--output results.json]
+    python benchmarks/suite.py --compare baseline.json
+
+For every case and build phase (traverse, dumps, validate) it reports the
+best wall time over the repeats, the number of memory blocks still
+allocated after the phase and the peak traced memory of the phase. Results
+are written as JSON so runs on different commits can be compared.
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import specs
+
+from build_openapispec._base import Components, Traversal, dumps, validate_spec
+
+# case: (generator, parameters at scale 1, whether the validator can handle it)
+CASES = {
+    "paths": (specs.paths, {"n": 1000}, True),
+    "shared": (specs.shared, {"n": 4000, "m": 200}, True),
+    # the validator recurses once per nesting level
+    "deep": (specs.deep, {"depth": 2000}, False),
+    "wide": (specs.wide, {"width": 20000}, True),
+    "security": (specs.security, {"n": 2000}, True),
+}
+
+PHASES = ("traverse", "dumps", "validate")
+
+
+def _dump(traversal):
+    components = Components()
+    rv = dumps(traversal, components)
+    rv["openapi"] = "3.0.3"
+    if components:
+        rv["components"] = dict(components)
+    return rv
+
+
+def _phases(spec, validate: bool):
+    # the same steps as build(), one phase at a time
+    traversal = yield "traverse", Traversal, (spec,)
+    rv = yield "dumps", _dump, (traversal,)
+    if validate:
+        yield "validate", validate_spec, (rv,)
+
+
+def _run(spec, validate: bool, trace: bool):
+    results = {}
+    phases = _phases(spec, validate)
+    rv = None
+    try:
+        while True:
+            name, func, args = phases.send(rv)
+            if trace:
+                tracemalloc.start()
+            blocks = sys.getallocatedblocks()
+            start = time.perf_counter()
+            rv = func(*args)
+            seconds = time.perf_counter() - start
+            allocations = sys.getallocatedblocks() - blocks
+            peak = None
+            if trace:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            results[name] = (seconds, allocations, peak)
+    except StopIteration:
+        pass
+    return results
+
+
+def measure(factory, params, *, repeat: int, validate: bool):
+    best = {}
+    for _ in range(repeat):
+        # a fresh document each time, so nothing cached on the nodes is reused
+        for name, (seconds, allocations, _) in _run(
+            factory(**params), validate, trace=False
+        ).items():
+            if name not in best or seconds < best[name]["seconds"]:
+                best[name] = {"seconds": seconds, "allocations": allocations}
+    for name, (_, _, peak) in _run(factory(**params), validate, trace=True).items():
+        best[name]["peak_bytes"] = peak
+    return best
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    old = {(r["case"], r["phase"]): r for r in baseline["results"]}
+    for r in results["results"]:
+        b = old.get((r["case"], r["phase"]))
+        if b is None:
+            continue
+        print(
+            "%-10s %-9s time x%.2f  peak x%.2f"
+            % (
+                r["case"],
+                r["phase"],
+                r["seconds"] / b["seconds"],
+                r["peak_bytes"] / b["peak_bytes"] if b["peak_bytes"] else float("nan"),
+            )
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--case", action="append", choices=sorted(CASES))
+    parser.add_argument("--no-validate", dest="validate", action="store_false")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="compare against a previous JSON result")
+    args = parser.parse_args(argv)
+
+    results = {
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "scale": args.scale,
+        "results": [],
+    }
+    for case in args.case or CASES:
+        factory, params, validate = CASES[case]
+        params = {k: max(int(v * args.scale), 1) for k, v in params.items()}
+        for phase, r in measure(
+            factory, params, repeat=args.repeat, validate=validate and args.validate
+        ).items():
+            results["results"].append(
+                {"case": case, "params": params, "phase": phase, **r}
+            )
+            print(
+                "%-10s %-9s %8.3fs %10d blocks %8.1fMB peak"
+                % (case, phase, r["seconds"], r["allocations"], r["peak_bytes"] / 2**20)
+            )
+
+    if args.output:
+        with open(args.output, "w") as fp:
+            json.dump(results, fp, indent=2)
+    if args.compare:
+        with open(args.compare) as fp:
+            compare(results, json.load(fp))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import asyncio
+import threading
+import typing as t
+from collections import OrderedDict
+from concurrent.futures import Executor
+from contextlib import contextmanager
+from functools import partial
+
+from ._base import Root, _stable_repr, build, fingerprint, freeze
+
+# 不影响结果内容的选项，不参与 key 的计算
+_ignored = ("hook", "stats", "validation_cache", "snapshot", "interner")
+
+
+class BuildCache:
+    """
+    按输入树的指纹、OpenAPI 版本和构建选项缓存 abuild() 的结果，最多保留 maxsize 个。
+    结果经过 freeze()，可以同时交给多个调用者。
+
+    选项按 _stable_repr() 计入 key；include 等选项为闭包或 lambda 时无法得到稳定的 key，
+    key() 抛出 ValueError，abuild() 此时不使用缓存。
+    """
+
+    def __init__(self, *, maxsize: int = 8) -> None:
+        self.maxsize = maxsize
+        self._cache: t.OrderedDict[t.Tuple[str, ...], t.Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, version: str, openapi, **options: t.Any) -> t.Tuple[str, ...]:
+        deduplicate = options.get("deduplicate")
+        if deduplicate is not None:
+            options["deduplicate"] = vars(deduplicate)
+        parts = [
+            "%s=%s" % (name, _stable_repr(name, value))
+            for name, value in sorted(options.items())
+            if name not in _ignored
+        ]
+        return (version, fingerprint(openapi), *parts)
+
+    def get(self, key: t.Tuple[str, ...]):
+        with self._lock:
+            rv = self._cache.get(key)
+            if rv is not None:
+                self._cache.move_to_end(key)
+            return rv
+
+    def set(self, key: t.Tuple[str, ...], rv) -> None:
+        with self._lock:
+            self._cache[key] = rv
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+@contextmanager
+def _checkpoint(cancelled: threading.Event, hook, name: str):
+    # 在每个阶段开始前检查调用者是否已经取消
+    if cancelled.is_set():
+        raise asyncio.CancelledError
+    if hook is None:
+        yield
+    else:
+        with hook(name):
+            yield
+
+
+def _run(version, openapi, cache: t.Optional[BuildCache], cancelled, options):
+    hook = options.pop("hook", None)
+    if cache is not None:
+        try:
+            key = cache.key(version, openapi, **options)
+        except ValueError:
+            cache = None
+    if cache is not None:
+        rv = cache.get(key)
+        if rv is not None:
+            return rv
+    rv = build(version, openapi, hook=partial(_checkpoint, cancelled, hook), **options)
+    if cache is not None:
+        rv = freeze(rv)
+        cache.set(key, rv)
+    return rv
+
+
+async def abuild(
+    version,
+    openapi,
+    /,
+    *,
+    executor: t.Optional[Executor] = None,
+    cache: t.Optional[BuildCache] = None,
+    **options: t.Any,
+):
+    """
+    在 executor（默认为事件循环的默认线程池）中执行 build()，不阻塞事件循环，其他参数与 build() 相同。
+
+    取消时构建在下一个阶段开始前停止。指定 cache 时相同的输入直接返回缓存的结果，
+    指纹的计算也在 executor 中进行；此时返回的文档是不可变的（见 freeze()）。
+    """
+    assert isinstance(openapi, Root)
+    loop = asyncio.get_running_loop()
+    cancelled = threading.Event()
+    future = loop.run_in_executor(
+        executor, _run, version, openapi, cache, cancelled, options
+    )
+    try:
+        return await future
+    except asyncio.CancelledError:
+        cancelled.set()
+        raise
@@ -1,16 +1,22 @@
 from __future__ import annotations
 
+import hashlib
+import heapq
+import json
+import mmap
+import os
+import re
+import threading
+import time
 import typing as t
 import warnings
-from collections import UserDict, defaultdict
+import zlib
+from collections import Counter, OrderedDict, UserDict, defaultdict
 from collections.abc import Mapping
+from contextlib import ExitStack, contextmanager, nullcontext
 from functools import partial
-from inspect import cleandoc
 from types import SimpleNamespace
 
-from openapi_spec_validator import validate as validate_spec
-from openapi_spec_validator.validation.exceptions import OpenAPIValidationError
-
 
 class Empty:
     __instance = None
@@ -24,112 +30,348 @@ class Empty:
 empty = Empty()
 
 
+def _identity(value):
+    return value
+
+
+def cleandoc(doc: str) -> str:
+    # inspect 导入较慢，第一次用到时才导入
+    from inspect import cleandoc
+
+    return cleandoc(doc)
+
+
 class Field:
-    def __init__(self, *, default: t.Any = empty, transform=None):
+    """
+    multiple 为真时值也可以是 choices 中的元素组成的列表。
+    versions 按次版本号（如 "3.1"）给出该版本的 required、choices 和 multiple 规则。
+    """
+
+    def __init__(
+        self,
+        *,
+        default: t.Any = empty,
+        transform=None,
+        required: bool = False,
+        choices: t.Optional[t.Collection[t.Any]] = None,
+        multiple: bool = False,
+        versions: t.Optional[t.Mapping[str, Field]] = None,
+    ):
         self.default = default
-        self.transform: t.Callable[[t.Any], t.Any] = transform or (lambda x: x)
+        self.transform: t.Callable[[t.Any], t.Any] = transform or _identity
+        self.required = required
+        self.choices = choices
+        self.multiple = multiple
+        self.versions = versions or {}
+
+    def _invalid(self, value) -> bool:
+        if self.choices is None:
+            return False
+        if self.multiple and isinstance(value, list):
+            return not value or any(v not in self.choices for v in value)
+        return value not in self.choices
+
+
+def _minor(version: str) -> str:
+    return ".".join(version.split(".")[:2])
+
+
+_unresolved = object()
+_lazy_lock = threading.RLock()
+
+
+class Lazy:
+    """
+    延迟提供的值。第一次被遍历（count_references / build）时调用 factory，
+    结果缓存下来并替换容器中的 Lazy，没有被遍历到的部分不会被构造。
+    可以用于前向引用和相互引用。
+    """
+
+    __slots__ = ("factory", "_value")
+
+    def __init__(self, factory: t.Callable[[], t.Any], /) -> None:
+        self.factory: t.Optional[t.Callable[[], t.Any]] = factory
+        self._value: t.Any = _unresolved
+
+    def resolve(self):
+        value = self._value
+        if value is _unresolved:
+            with _lazy_lock:
+                value = self._value
+                if value is _unresolved:
+                    assert self.factory is not None
+                    value = self.factory()
+                    if isinstance(value, Lazy):
+                        value = value.resolve()
+                    self._value = value
+                    self.factory = None
+        return value
+
+    def __repr__(self) -> str:
+        if self._value is _unresolved:
+            return "Lazy(%r)" % self.factory
+        return "Lazy(%r)" % (self._value,)
 
 
 class Schema(Mapping):
+    """
+    声明的字段在构造时只去掉默认值，transform 推迟到第一次读取值时执行，结果保留在节点上。
+    按对象身份哈希，按内容比较。
+    """
+
+    # _fingerprint 缓存内容指纹，见 fingerprint()；_errors 按次版本号缓存节点自身的检查结果，
+    # 见 errors()。
+    # 保留对弱引用的支持
+    __slots__ = ("__fields", "__pending", "_fingerprint", "_errors", "__weakref__")
     __declare_fields__: t.Dict[str, Field] = {}
+    __defaults__: t.Dict[str, t.Any] = {}
+    __transforms__: t.Dict[str, t.Callable[[t.Any], t.Any]] = {}
+
+    def __init_subclass__(cls, **kwargs: t.Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls.__defaults__ = {
+            k: f.default
+            for k, f in cls.__declare_fields__.items()
+            if f.default is not empty
+        }
+        cls.__transforms__ = {
+            k: f.transform
+            for k, f in cls.__declare_fields__.items()
+            if f.transform is not _identity
+        }
 
     def __init__(self, fields=None, /) -> None:
-        data = {}
-        if fields:
-            data.update(fields)
+        self.__fields: t.Dict[t.Any, t.Any] = {}
+        self.__pending = bool(self.__transforms__)
+        self._fingerprint: t.Optional[str] = None
+        self._errors: t.Optional[t.Dict[str, t.Tuple[str, ...]]] = None
+        if not fields:
+            return
 
-        self.__fields = {}
-        for k, v in data.items():
-            if v is empty:
+        try:
+            items = fields.items()
+        except AttributeError:
+            items = fields
+        defaults = self.__defaults__
+        data = self.__fields
+        for k, v in items:
+            if v is empty or defaults.get(k, empty) is v:
                 continue
+            data[k] = v
+
+    def __resolve(self) -> t.Dict[t.Any, t.Any]:
+        # 在副本上执行 transform 再替换，并发读取时也不会重复 transform 同一个值
+        data = self.__fields
+        names = [k for k in self.__transforms__ if k in data]
+        if names:
+            data = dict(data)
+            for k in names:
+                v = data[k]
+                if isinstance(v, Lazy):
+                    v = v.resolve()
+                data[k] = self.__transforms__[k](v)
+            self.__fields = data
+        self.__pending = False
+        return data
 
-            if k in self.__declare_fields__:
-                f = self.__declare_fields__[k]
-                if f.default is v:
-                    continue
-                v = f.transform(v)
-
-            self.__fields[k] = v
-
-        self.__hash = object()
+    def _evolve(self, fields: t.Dict[t.Any, t.Any]):
+        # 同类型、字段不同的新节点，字段已经处理过，不再过滤和 transform
+        new = object.__new__(type(self))
+        new.__fields = fields
+        new.__pending = False
+        new._fingerprint = None
+        new._errors = None
+        return new
+
+    def errors(self, version: str = "3.0.3") -> t.Tuple[str, ...]:
+        """
+        按目标版本检查节点自身的规则（不包括子节点），结果缓存在节点上。
+        """
+        minor = _minor(version)
+        cache = self._errors
+        if cache is None:
+            cache = self._errors = {}
+        rv = cache.get(minor)
+        if rv is None:
+            rv = cache[minor] = tuple(self._check(minor))
+        return rv
+
+    def _check(self, version: str) -> t.Iterator[str]:
+        # version 为次版本号
+        for k, f in self.__declare_fields__.items():
+            f = f.versions.get(version, f)
+            if k not in self:
+                if f.required:
+                    yield "%s: %r is required" % (type(self).__name__, k)
+            elif f._invalid(self[k]):
+                yield "%s: %r must be one of %s, got %r" % (
+                    type(self).__name__,
+                    k,
+                    ", ".join(map(repr, f.choices)),
+                    self[k],
+                )
+
+    def _materialize(self) -> None:
+        data = self.__fields
+        for k, v in data.items():
+            if isinstance(v, Lazy):
+                data[k] = v.resolve()
 
     def __getitem__(self, name):
+        if self.__pending:
+            return self.__resolve()[name]
         return self.__fields[name]
 
+    def __contains__(self, name) -> bool:
+        return name in self.__fields
+
     def __iter__(self):
         return iter(self.__fields)
 
+    def keys(self):
+        return self.__fields.keys()
+
+    def values(self):
+        if self.__pending:
+            return self.__resolve().values()
+        return self.__fields.values()
+
+    def items(self):
+        if self.__pending:
+            return self.__resolve().items()
+        return self.__fields.items()
+
     def __len__(self):
         return len(self.__fields)
 
-    def __hash__(self) -> int:
-        return hash(self.__hash)
+    __hash__ = object.__hash__
 
     def __repr__(self) -> str:
-        return repr(self.__fields)
+        return repr(dict(self.items()))
+
+
+# components 中 key 的格式
+_component_key = re.compile(r"[a-zA-Z0-9.\-_]+")
 
 
 class Root:
-    pass
+    __slots__ = ()
 
 
 class OpenAPIObject(Schema, Root):
-    pass
+    __slots__ = ()
+    __declare_fields__ = {
+        "info": Field(required=True),
+        # 3.1 中 paths、webhooks 和 components 至少有一个即可，由完整校验检查
+        "paths": Field(required=True, versions={"3.1": Field()}),
+    }
 
 
 class InfoObject(Schema):
+    __slots__ = ()
     __declare_fields__ = {
+        "title": Field(required=True),
+        "version": Field(required=True),
         "description": Field(transform=cleandoc),
     }
 
 
 class PathItemObject(Schema):
+    __slots__ = ()
     __declare_fields__ = {
         "description": Field(transform=cleandoc),
     }
 
 
 class OperationObject(Schema):
+    __slots__ = ()
     __declare_fields__ = {
+        "responses": Field(required=True),
         "description": Field(transform=cleandoc),
         "deprecated": Field(default=False),
     }
 
 
-class ParameterObject(Schema):
+class _Reusable(Schema):
+    """
+    可以放在 components 中复用的对象。指定 key 的节点与 SchemaObject 一样按引用计数，
+    出现多次时提升到 components 中的 __component__ 字段并转为 $ref；没有 key 的节点总是内联。
+    """
+
+    __slots__ = ("key",)
+    __component__: t.ClassVar[str] = ""
+
+    def __init__(self, *args: t.Any, key: t.Optional[str] = None) -> None:
+        super().__init__(*args)
+        self.key = key
+
+    def _check(self, version: str) -> t.Iterator[str]:
+        yield from super()._check(version)
+        if self.key is not None and not _component_key.fullmatch(self.key):
+            yield "%s: invalid key %r" % (type(self).__name__, self.key)
+
+
+class ParameterObject(_Reusable):
+    __slots__ = ()
+    __component__ = "parameters"
     __declare_fields__ = {
+        "name": Field(required=True),
+        "in": Field(required=True, choices=("query", "header", "path", "cookie")),
         "required": Field(default=False),
         "description": Field(transform=cleandoc),
         "deprecated": Field(default=False),
     }
 
+    def _check(self, version: str) -> t.Iterator[str]:
+        yield from super()._check(version)
+        if self.get("in") == "path" and self.get("required") is not True:
+            yield "ParameterObject: path parameter %r must be required" % self.get(
+                "name"
+            )
 
-class RequestBodyObject(Schema):
+
+class RequestBodyObject(_Reusable):
+    __slots__ = ()
+    __component__ = "requestBodies"
     __declare_fields__ = {
+        "content": Field(required=True),
         "required": Field(default=False),
         "description": Field(transform=cleandoc),
     }
 
 
-class ResponseObject(Schema):
+class ResponseObject(_Reusable):
+    __slots__ = ()
+    __component__ = "responses"
     __declare_fields__ = {
-        "description": Field(transform=cleandoc),
+        "description": Field(transform=cleandoc, required=True),
     }
 
 
 class MediaTypeObject(Schema):
-    pass
+    __slots__ = ()
 
 
 class TagObject(Schema):
+    __slots__ = ()
     __declare_fields__ = {
+        "name": Field(required=True),
         "description": Field(transform=cleandoc),
     }
 
 
+_types = ("array", "boolean", "integer", "number", "object", "string")
+
+
 class SchemaObject(Schema):
+    __slots__ = ("key",)
+    __component__ = "schemas"
     __declare_fields__ = {
         "description": Field(transform=cleandoc),
+        "type": Field(
+            choices=_types,
+            versions={"3.1": Field(choices=(*_types, "null"), multiple=True)},
+        ),
         "readOnly": Field(default=False),
         "writeOnly": Field(default=False),
         "uniqueItems": Field(default=False),
@@ -142,9 +384,23 @@ class SchemaObject(Schema):
         super().__init__(*args)
         self.key = key
 
+    def _check(self, version: str) -> t.Iterator[str]:
+        yield from super()._check(version)
+        if self.key is not None and not _component_key.fullmatch(self.key):
+            yield "SchemaObject: invalid key %r" % self.key
+
+
+_schemes = ("apiKey", "http", "oauth2", "openIdConnect")
+
 
 class SecuritySchemeObject(Schema):
+    __slots__ = ("key",)
     __declare_fields__ = {
+        "type": Field(
+            required=True,
+            choices=_schemes,
+            versions={"3.1": Field(required=True, choices=(*_schemes, "mutualTLS"))},
+        ),
         "description": Field(transform=cleandoc),
     }
 
@@ -154,11 +410,51 @@ class SecuritySchemeObject(Schema):
 
 
 class SecurityRequirementObject(Schema):
+    __slots__ = ("scheme",)
 
     def __init__(self, *args, scheme: SecuritySchemeObject) -> None:
         self.scheme = scheme
         super().__init__({scheme.key: []})
 
+    def _check(self, version: str) -> t.Iterator[str]:
+        yield from super()._check(version)
+        # scheme 不在文档树中，在这里一并检查
+        if not isinstance(self.scheme, SecuritySchemeObject):
+            yield "SecurityRequirementObject: scheme must be a SecuritySchemeObject"
+        elif not _component_key.fullmatch(self.scheme.key or ""):
+            yield "SecuritySchemeObject: invalid key %r" % self.scheme.key
+        else:
+            yield from self.scheme.errors(version)
+
+
+def _import(module: str, name: str):
+    from importlib import import_module
+
+    return getattr(import_module(module, __package__), name)
+
+
+def _bound(module: str, name: str):
+    return lambda namespace: partial(_import(module, name), namespace.version)
+
+
+def _unbound(module: str, name: str):
+    return lambda namespace: _import(module, name)
+
+
+# 由其他模块提供的入口在第一次访问时才导入，例如 _async 会导入 asyncio
+_lazy_entries: t.Dict[str, t.Callable[[t.Any], t.Any]] = {
+    "abuild": _bound("._async", "abuild"),
+    "BuildCache": _unbound("._async", "BuildCache"),
+    "iterbuild": _bound("._stream", "iterbuild"),
+    "build_to_stream": _bound("._stream", "build_to_stream"),
+    "build_bundle": _bound("._bundle", "build_bundle"),
+    "diff": _unbound("._diff", "diff"),
+    "load": _bound("._load", "load"),
+    "SchemaGenerator": _unbound("._types", "SchemaGenerator"),
+    "schema_of": lambda namespace: _import("._types", "SchemaGenerator")(),
+}
+_entries_lock = threading.RLock()
+
 
 class OpenAPISpecNamespace(SimpleNamespace):
     def __init__(self, version: str, **kwargs: t.Any) -> None:
@@ -167,29 +463,321 @@ class OpenAPISpecNamespace(SimpleNamespace):
             empty=empty,
             non_empty=non_empty,
             build=partial(build, version),
+            build_artifact=ArtifactBuilder(version),
+            builder=partial(CachedBuilder, version),
+            session=partial(BuildSession, version),
+            build_variants=partial(build_variants, version),
+            build_versions=build_versions,
+            ValidationCache=ValidationCache,
+            Snapshot=Snapshot,
+            Interner=Interner,
+            Deduplicate=Deduplicate,
+            BuildStats=BuildStats,
+            Lazy=Lazy,
+            check=partial(check, version),
+            fingerprint=fingerprint,
             **kwargs,
         )
 
+    def __getattr__(self, name: str):
+        factory = _lazy_entries.get(name)
+        if factory is None:
+            raise AttributeError(name)
+        # 结果保存在实例上，schema_of 等有状态的入口在各线程中是同一个对象
+        with _entries_lock:
+            if name not in self.__dict__:
+                setattr(self, name, factory(self))
+            return self.__dict__[name]
+
+    def __dir__(self):
+        return sorted({*super().__dir__(), *_lazy_entries})
+
+
+# 节点类别，按类型缓存以避免对 ABC 反复 isinstance
+SCALAR, MAPPING, LIST, SCHEMA_OBJECT, LAZY = 0, 1, 2, 3, 4
+# 可复用对象的类别取决于实例：有 key 时与 SchemaObject 相同，否则是普通的 Mapping，见 _kind()
+REUSABLE = 5
+
+
+class _Kinds(dict):
+    def __missing__(self, tp: type) -> int:
+        if issubclass(tp, Lazy):
+            kind = LAZY
+        elif issubclass(tp, SchemaObject):
+            kind = SCHEMA_OBJECT
+        elif issubclass(tp, _Reusable):
+            kind = REUSABLE
+        elif issubclass(tp, Mapping):
+            kind = MAPPING
+        elif issubclass(tp, list):
+            kind = LIST
+        else:
+            kind = SCALAR
+        self[tp] = kind
+        return kind
+
+
+_kinds = _Kinds()
+
+
+def _kind(value) -> int:
+    kind = _kinds[type(value)]
+    if kind == REUSABLE:
+        return SCHEMA_OBJECT if value.key is not None else MAPPING
+    return kind
+
+
+def _iter_children(data):
+    if _kinds[type(data)] == LIST:
+        return data
+    return data.values()
+
+
+def _materialize(node, value: Lazy):
+    # 把 node 中所有的 Lazy 替换为结果，只替换已有的键，遍历中的迭代器不受影响
+    kind = _kinds[type(node)]
+    if kind == LIST:
+        for i, v in enumerate(node):
+            if isinstance(v, Lazy):
+                node[i] = v.resolve()
+    elif isinstance(node, Schema):
+        node._materialize()
+    else:
+        for k, v in node.items():
+            if isinstance(v, Lazy):
+                node[k] = v.resolve()
+    return value.resolve()
+
+
+class Traversal:
+    """
+    用显式栈遍历一棵 Schema 树，不受 Python 递归深度限制。
+
+    第一遍按深度优先得到每个容器节点（Mapping / list）的序列化顺序（后序），
+    有环时改用 Tarjan 强连通分量算法；第二遍按逆序传播出现次数，
+    得到与逐个展开等价的引用计数。
+
+    boundary 为真时不进入根节点以外的 SchemaObject，只统计对它们的直接引用。
+    groups 中每组 SchemaObject 视为同一个节点，统一使用组内第一个，
+    keys 为没有 key 的 SchemaObject（按 id）指定生成的 key。
+    """
+
+    def __init__(
+        self,
+        root,
+        *,
+        boundary: bool = False,
+        groups: t.Iterable[t.List[SchemaObject]] = (),
+        keys: t.Optional[t.Dict[int, str]] = None,
+    ) -> None:
+        self.root = root
+        self.boundary = boundary
+        self.keys = keys or {}
+        self.order: t.List[t.Any] = []
+        self.references: t.Dict[SchemaObject, int] = defaultdict(int)
+        self.recursive: t.Set[SchemaObject] = set()
+
+        self.substitute: t.Dict[int, SchemaObject] = {}
+        self.duplicates: t.Dict[int, t.List[SchemaObject]] = {}
+        for canonical, *duplicates in groups:
+            if duplicates:
+                self.duplicates[id(canonical)] = duplicates
+                self.substitute.update((id(n), canonical) for n in duplicates)
+
+        if not self._walk():
+            self.order.clear()
+            self._walk_cyclic()
+        self._count()
+
+        for duplicates in self.duplicates.values():
+            canonical = self.substitute[id(duplicates[0])]
+            for n in duplicates:
+                if n in self.references:
+                    self.references[canonical] += self.references.pop(n)
+
+    def _children(self, node):
+        substitute = self.substitute
+        for value in _iter_children(node):
+            if substitute and _kind(value) == SCHEMA_OBJECT:
+                value = substitute.get(id(value), value)
+            yield value
+
+    def key(self, node) -> t.Optional[str]:
+        return self.keys.get(id(node)) or node.key
+
+    def _walk(self) -> bool:
+        # 没有环时的快速路径，遇到环返回 False
+        ACTIVE, DONE = 1, 2
+        kinds = _kinds
+        boundary = self.boundary
+        substitute = self.substitute
+        children_of = self._children if substitute else _iter_children
+        state: t.Dict[int, int] = {id(self.root): ACTIVE}
+        stack = [(self.root, iter(children_of(self.root)))]
+        order = self.order
+
+        while stack:
+            node, children = stack[-1]
+            for value in children:
+                kind = kinds[type(value)]
+                if not kind:
+                    continue
+                if kind == LAZY:
+                    value = _materialize(node, value)
+                    kind = kinds[type(value)]
+                    if not kind:
+                        continue
+                if boundary and _kind(value) == SCHEMA_OBJECT:
+                    continue
+                s = state.get(id(value))
+                if s is None:
+                    state[id(value)] = ACTIVE
+                    stack.append((value, iter(children_of(value))))
+                    break
+                if s == ACTIVE:
+                    return False
+            else:
+                stack.pop()
+                state[id(node)] = DONE
+                order.append(node)
+        return True
+
+    def _walk_cyclic(self):
+        # Tarjan 强连通分量算法，按分量的逆拓扑序输出
+        DONE = -1
+        kinds = _kinds
+        boundary = self.boundary
+        index: t.Dict[int, int] = {id(self.root): 0}
+        pending = [self.root]
+        loops: t.Set[int] = set()
+        # 栈帧：[节点, 子节点迭代器, index, lowlink]
+        stack = [[self.root, iter(self._children(self.root)), 0, 0]]
+
+        while stack:
+            frame = stack[-1]
+            for value in frame[1]:
+                kind = kinds[type(value)]
+                if not kind:
+                    continue
+                if kind == LAZY:
+                    value = _materialize(frame[0], value)
+                    kind = kinds[type(value)]
+                    if not kind:
+                        continue
+                if boundary and _kind(value) == SCHEMA_OBJECT:
+                    continue
+                i = index.get(id(value))
+                if i is None:
+                    i = index[id(value)] = len(index)
+                    pending.append(value)
+                    stack.append([value, iter(self._children(value)), i, i])
+                    break
+                if i != DONE:
+                    if i < frame[3]:
+                        frame[3] = i
+                    elif value is frame[0]:
+                        loops.add(i)
+            else:
+                stack.pop()
+                node, _, i, low = frame
+                if low != i:
+                    parent = stack[-1]
+                    if low < parent[3]:
+                        parent[3] = low
+                    continue
+
+                # node 是一个强连通分量的根
+                if pending[-1] is node and i not in loops:
+                    pending.pop()
+                    index[id(node)] = DONE
+                    self.order.append(node)
+                    continue
+
+                i = len(pending) - 1
+                while pending[i] is not node:
+                    i -= 1
+                component = pending[i:]
+                del pending[i:]
+                for n in component:
+                    index[id(n)] = DONE
+                self._order_cycle(component)
+
+    def _order_cycle(self, component: t.List[t.Any]):
+        # 只有带 key 的 SchemaObject 可以被自身（间接）引用，它将被转为 $ref。
+        # 去掉指向它们的边后，分量内的其余节点必须无环，按后序排列即为序列化顺序。
+        kinds = _kinds
+        members = {id(n) for n in component}
+        for n in component:
+            if _kind(n) == SCHEMA_OBJECT and self.key(n):
+                self.recursive.add(n)
+                members.discard(id(n))
+
+        ACTIVE, DONE = 1, 2
+        state: t.Dict[int, int] = {}
+        for start in component:
+            if id(start) in state:
+                continue
+            state[id(start)] = ACTIVE
+            stack = [(start, iter(self._children(start)))]
+            while stack:
+                node, children = stack[-1]
+                for value in children:
+                    if id(value) not in members:
+                        continue
+                    s = state.get(id(value))
+                    if s is None:
+                        state[id(value)] = ACTIVE
+                        stack.append((value, iter(self._children(value))))
+                        break
+                    if s == ACTIVE:
+                        raise ValueError(
+                            "Circular reference detected at %r, "
+                            "only SchemaObject with a key can reference itself" % value
+                        )
+                else:
+                    stack.pop()
+                    state[id(node)] = DONE
+                    self.order.append(node)
+
+    def _count(self):
+        # SchemaObject 只展开一次，其余容器节点每出现一次就展开一次
+        references = self.references
+        kinds = _kinds
+        multiplicity: t.Dict[int, int] = defaultdict(int)
+        multiplicity[id(self.root)] = 1
+        if _kind(self.root) == SCHEMA_OBJECT:
+            references[self.root] += 1
+
+        for node in reversed(self.order):
+            kind = kinds[type(node)]
+            if kind == REUSABLE:
+                kind = _kind(node)
+            m = 1 if kind == SCHEMA_OBJECT else multiplicity[id(node)]
+            for value in node if kind == LIST else node.values():
+                kind = kinds[type(value)]
+                if kind == REUSABLE:
+                    kind = _kind(value)
+                if kind == SCHEMA_OBJECT:
+                    references[value] += m
+                elif kind:
+                    multiplicity[id(value)] += m
+
+    def is_reference(self, node) -> bool:
+        if self.boundary and node is self.root:
+            return False
+        return (
+            _kind(node) == SCHEMA_OBJECT
+            and bool(self.key(node))
+            and (self.references[node] > 1 or node in self.recursive)
+        )
+
 
 def count_references(data):
-    references: t.Dict[SchemaObject, int] = defaultdict(int)
-    visited: t.Set[SchemaObject] = set()
-
-    def count_recursive(data):
-        if isinstance(data, Mapping):
-            if isinstance(data, SchemaObject):
-                references[data] += 1
-                if data in visited:
-                    return  # 避免重复引用计数
-                visited.add(data)
-            for value in data.values():
-                count_recursive(value)
-        elif isinstance(data, list):
-            for value in data:
-                count_recursive(value)
-
-    count_recursive(data)
-    return references
+    return Traversal(data).references
+
+
+def _reference(node, key: str) -> t.Dict[str, str]:
+    return {"$ref": "#/components/%s/%s" % (type(node).__component__, key)}
 
 
 class Components(UserDict):
@@ -198,60 +786,1523 @@ class Components(UserDict):
         values[key] = value
 
 
+def _merge_components(declared, components: Components) -> t.Dict[str, t.Any]:
+    # 文档中声明的 components（例如 load() 保留的 securitySchemes、headers）与提升的组件合并，
+    # 同名时使用提升的组件
+    rv = dict(declared) if isinstance(declared, Mapping) else {}
+    for field, values in components.items():
+        existing = rv.get(field)
+        rv[field] = {**existing, **values} if isinstance(existing, Mapping) else values
+    return rv
+
+
+def _versioned_fields(data: t.Mapping[str, t.Any]) -> bool:
+    return (
+        "nullable" in data or "exclusiveMinimum" in data or "exclusiveMaximum" in data
+    )
+
+
+def _schema_31(data: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
+    # 3.0 的 nullable 和布尔值的 exclusiveMinimum / exclusiveMaximum 转为 3.1（JSON Schema）的写法
+    if not _versioned_fields(data):
+        return data
+    data = dict(data)
+    for exclusive, bound in (
+        ("exclusiveMinimum", "minimum"),
+        ("exclusiveMaximum", "maximum"),
+    ):
+        if data.get(exclusive) is True and bound in data:
+            data[exclusive] = data.pop(bound)
+        elif isinstance(data.get(exclusive), bool):
+            del data[exclusive]
+    if data.pop("nullable", False):
+        if "enum" in data and None not in data["enum"]:
+            data["enum"] = [*data["enum"], None]
+        if "type" not in data:
+            return {"anyOf": [data, {"type": "null"}]}
+        if isinstance(data["type"], list):
+            data["type"] = [*data["type"], "null"]
+        else:
+            data["type"] = [data["type"], "null"]
+    return data
+
+
+def _convert(version: str) -> t.Optional[t.Callable[[dict], dict]]:
+    # 按目标版本转换 SchemaObject 的内容，3.0.x 不需要转换
+    return _schema_31 if version.startswith("3.1.") else None
+
+
+_methods = ("get", "put", "post", "delete", "options", "head", "patch", "trace")
+
+# 文档中各位置的角色，用于找出作为 schema 使用的普通 dict。
+# 角色 -> {字段: (子节点的角色, 是否对子节点中的每一项生效)}，"*" 匹配任意字段
+_roles: t.Dict[str, t.Dict[str, t.Tuple[str, bool]]] = {
+    "schema": {
+        "items": ("schema", False),
+        "additionalProperties": ("schema", False),
+        "not": ("schema", False),
+        "properties": ("schema", True),
+        "allOf": ("schema", True),
+        "anyOf": ("schema", True),
+        "oneOf": ("schema", True),
+    },
+    # parameter、header、media type、response、request body 和 encoding
+    "holder": {
+        "schema": ("schema", False),
+        "content": ("holder", True),
+        "headers": ("holder", True),
+        "encoding": ("holder", True),
+    },
+    "operation": {
+        "parameters": ("holder", True),
+        "requestBody": ("holder", False),
+        "responses": ("holder", True),
+        "callbacks": ("paths", True),
+    },
+    "path": {
+        "parameters": ("holder", True),
+        **dict.fromkeys(_methods, ("operation", False)),
+    },
+    "paths": {"*": ("path", False)},
+    "root": {
+        "paths": ("paths", False),
+        "webhooks": ("paths", False),
+        "components": ("components", False),
+    },
+    "components": {
+        "schemas": ("schema", True),
+        "parameters": ("holder", True),
+        "headers": ("holder", True),
+        "responses": ("holder", True),
+        "requestBodies": ("holder", True),
+        "callbacks": ("paths", True),
+        "pathItems": ("path", True),
+    },
+}
+
+
+def _role(node) -> t.Optional[str]:
+    if isinstance(node, SchemaObject):
+        return "schema"
+    if isinstance(node, (MediaTypeObject, _Reusable)):
+        return "holder"
+    if isinstance(node, OperationObject):
+        return "operation"
+    if isinstance(node, PathItemObject):
+        return "path"
+    if isinstance(node, Root):
+        return "root"
+    return None
+
+
+def _plain_schemas(traversal: Traversal, role: str = "root") -> t.Set[int]:
+    # 按所在位置找出作为 schema 使用的普通 dict；后序的逆序中父节点先于子节点。
+    # role 为根节点不是对应的 Schema 类型时的角色，例如 BuildSession 中由字段组成的根
+    kinds = _kinds
+    roles: t.Dict[int, str] = {id(traversal.root): _role(traversal.root) or role}
+    rv: t.Set[int] = set()
+    for node in reversed(traversal.order):
+        role = _role(node) or roles.get(id(node))
+        if role is None or kinds[type(node)] == LIST:
+            continue
+        if role == "schema" and not isinstance(node, Schema):
+            rv.add(id(node))
+        fields = _roles[role]
+        for name, value in node.items():
+            child = fields.get(name) or fields.get("*")
+            if child is None or not kinds[type(value)]:
+                continue
+            child_role, each = child
+            if not each:
+                roles.setdefault(id(value), child_role)
+                continue
+            for item in value if kinds[type(value)] == LIST else value.values():
+                if kinds[type(item)]:
+                    roles.setdefault(id(item), child_role)
+    return rv
+
+
+def _versioned(traversal: Traversal, plain: t.Set[int]) -> t.Set[int]:
+    # 内容（包括内联的子节点）与目标版本有关的节点，其余节点的结果可以在各版本间共享
+    kinds = _kinds
+    children_of = traversal._children if traversal.substitute else _iter_children
+    rv: t.Set[int] = set()
+    for node in traversal.order:
+        if (isinstance(node, SchemaObject) or id(node) in plain) and _versioned_fields(
+            node
+        ):
+            rv.add(id(node))
+            continue
+        for value in children_of(node):
+            if (
+                kinds[type(value)]
+                and id(value) in rv
+                and not traversal.is_reference(value)
+            ):
+                rv.add(id(node))
+                break
+    return rv
+
+
+def dumps(
+    traversal: Traversal,
+    components: Components,
+    dumped: t.Optional[t.Dict[int, t.Any]] = None,
+    *,
+    version: str = "3.0.3",
+    bodies: t.Optional[t.Dict[int, t.Any]] = None,
+    reuse: t.Optional[t.Dict[int, t.Any]] = None,
+    plain: t.Optional[t.Set[int]] = None,
+):
+    # 按后序逐个序列化，每个节点只序列化一次，再次出现时直接复用结果（$ref 或已构建的 dict）。
+    # boundary 遍历时由调用方通过 dumped 提供子 SchemaObject 的结果。
+    # bodies 记录每个节点转为 $ref 之前的结果；reuse 中的节点直接使用另一个版本的结果。
+    # plain 为作为 schema 使用的普通 dict（按 id），默认由 _plain_schemas 得到
+    if dumped is None:
+        dumped = {}
+    kinds = _kinds
+    convert = _convert(version)
+    if convert is not None and plain is None:
+        plain = _plain_schemas(traversal)
+
+    # 递归引用的节点在子节点之前就需要 $ref，所以先占位
+    for node in traversal.recursive:
+        dumped[id(node)] = _reference(node, traversal.key(node))
+
+    for node in traversal.order:
+        kind = kinds[type(node)]
+        if kind == REUSABLE:
+            kind = _kind(node)
+        if reuse is not None and id(node) in reuse:
+            data = reuse[id(node)]
+        elif kind == LIST:
+            data = [dumped[id(v)] if kinds[type(v)] else v for v in node]
+        else:
+            data = {k: dumped[id(v)] if kinds[type(v)] else v for k, v in node.items()}
+            if convert is not None and (
+                isinstance(node, SchemaObject) or id(node) in plain
+            ):
+                data = convert(data)
+        if bodies is not None:
+            bodies[id(node)] = data
+        if kind == LIST:
+            dumped[id(node)] = data
+            continue
+
+        # schema object 以及有 key 的 parameter、response、request body
+        if kind == SCHEMA_OBJECT and traversal.is_reference(node):
+            key = traversal.key(node)
+            components.setfield(type(node).__component__, key, data)
+            data = dumped.get(id(node)) or _reference(node, key)
+
+        # security scheme，每个 scheme 只复制一次
+        elif isinstance(node, SecurityRequirementObject):
+            scheme = node.scheme
+            if id(scheme) not in dumped:
+                dumped[id(scheme)] = dict(scheme)
+                components.setfield("securitySchemes", scheme.key, dumped[id(scheme)])
+
+        dumped[id(node)] = data
+        if traversal.duplicates:
+            for n in traversal.duplicates.get(id(node), ()):
+                dumped[id(n)] = data
+
+    return dumped[id(traversal.root)]
+
+
+def _digest(node, fingerprints: t.Mapping[int, str], recursive, key) -> str:
+    # 节点的内容指纹，子节点的指纹由 fingerprints 提供。有 key 的 SchemaObject 连同 key 计入，
+    # 环上的 SchemaObject（一定有 key）只计入 key
+    kinds = _kinds
+    kind = kinds[type(node)]
+    h = hashlib.sha1(type(node).__name__.encode())
+    for name, value in enumerate(node) if kind == LIST else node.items():
+        k = kinds[type(value)]
+        if k == REUSABLE:
+            k = _kind(value)
+        if not k:
+            token = repr(value)
+        elif k == SCHEMA_OBJECT and value in recursive:
+            token = "R" + key(value)
+        else:
+            token = fingerprints[id(value)]
+            if k == SCHEMA_OBJECT and key(value):
+                token = "K%s:%s" % (key(value), token)
+        h.update(("\0%r\0%s" % (name, token)).encode())
+    if isinstance(node, SecurityRequirementObject):
+        # scheme 不在文档树中，单独计入
+        h.update(("\0\0%s" % fingerprint(node.scheme)).encode())
+    return h.hexdigest()
+
+
+def _schema_key(node) -> t.Optional[str]:
+    return node.key
+
+
+def fingerprint(node) -> str:
+    """
+    节点内容的指纹（sha1），自底向上计算，Schema 节点上缓存结果，
+    已有指纹的子树不再遍历。内容相同的树得到相同的指纹，与对象身份无关。
+
+    与 count_references 一样，节点加入文档后应视为不可变。
+    """
+    node = _resolved(node)
+    if isinstance(node, Schema) and node._fingerprint is not None:
+        return node._fingerprint
+
+    # 没有环时的快速路径，遇到已缓存的 Schema 节点时不再深入
+    ACTIVE, DONE = 1, 2
+    kinds = _kinds
+    fingerprints: t.Dict[int, str] = {}
+    state: t.Dict[int, int] = {id(node): ACTIVE}
+    stack = [(node, iter(_iter_children(node)))]
+    order: t.List[t.Any] = []
+    recursive: t.Set[t.Any] = set()
+    while stack:
+        parent, children = stack[-1]
+        for value in children:
+            kind = kinds[type(value)]
+            if not kind:
+                continue
+            if kind == LAZY:
+                value = _materialize(parent, value)
+                if not kinds[type(value)]:
+                    continue
+            if isinstance(value, Schema) and value._fingerprint is not None:
+                fingerprints[id(value)] = value._fingerprint
+                continue
+            s = state.get(id(value))
+            if s is None:
+                state[id(value)] = ACTIVE
+                stack.append((value, iter(_iter_children(value))))
+                break
+            if s == ACTIVE:
+                # 有环，按 Traversal 的顺序计算
+                traversal = Traversal(node)
+                order = traversal.order
+                recursive = traversal.recursive
+                stack.clear()
+                break
+        else:
+            stack.pop()
+            state[id(parent)] = DONE
+            order.append(parent)
+
+    for n in order:
+        cached = n._fingerprint if isinstance(n, Schema) else None
+        if cached is None:
+            cached = _digest(n, fingerprints, recursive, _schema_key)
+            if isinstance(n, Schema):
+                n._fingerprint = cached
+        fingerprints[id(n)] = cached
+    return fingerprints[id(node)]
+
+
+class Deduplicate:
+    """
+    按内容合并结构相同的匿名 SchemaObject。合并后被引用不少于 min_references 次、
+    且节点数不少于 min_size 的提升到 components/schemas，key 由内容的哈希生成，
+    相同的内容总是得到相同的 key。
+    """
+
+    def __init__(
+        self, *, min_references: int = 2, min_size: int = 1, key_prefix: str = "Schema"
+    ) -> None:
+        self.min_references = max(min_references, 2)
+        self.min_size = min_size
+        self.key_prefix = key_prefix
+
+    def __call__(self, traversal: Traversal) -> Traversal:
+        kinds = _kinds
+        fingerprints: t.Dict[int, str] = {}
+        sizes: t.Dict[int, int] = {}
+        groups: t.Dict[str, t.List[SchemaObject]] = {}
+
+        # 后序保证子节点先于父节点得到指纹
+        for node in traversal.order:
+            kind = kinds[type(node)]
+            fingerprint = fingerprints[id(node)] = _digest(
+                node, fingerprints, traversal.recursive, traversal.key
+            )
+            size = 1
+            for value in _iter_children(node):
+                size += sizes[id(value)] if kinds[type(value)] else 1
+            sizes[id(node)] = size
+            if kind == SCHEMA_OBJECT and not traversal.key(node):
+                groups.setdefault(fingerprint, []).append(node)
+
+        selected = [
+            group
+            for group in groups.values()
+            if sizes[id(group[0])] >= self.min_size
+            and sum(traversal.references[n] for n in group) >= self.min_references
+        ]
+        if not selected:
+            return traversal
+
+        keys = {
+            id(group[0]): self.key_prefix + fingerprints[id(group[0])][:12]
+            for group in selected
+        }
+        return Traversal(traversal.root, groups=selected, keys=keys)
+
+
+# full：openapi-spec-validator；fast：各节点自身的规则；或以构建结果调用、返回错误信息的函数
+Validator = t.Union[t.Literal["full", "fast"], t.Callable[[dict], t.Iterable[str]]]
+
+
+# ValidationCache 在磁盘上的记录以 sha256 的十六进制摘要为文件名
+_digest_name = re.compile(r"[0-9a-f]{64}")
+
+
+class ValidationCache:
+    """
+    以文档内容的哈希记录已通过校验的文档，内容不变时跳过校验。
+
+    默认只保存在内存中；指定 directory 后同时保存在磁盘上，供其他进程复用。
+    内存和磁盘中最多各保留 maxsize 条，超出时淘汰最久未使用的记录。
+    """
+
+    def __init__(self, directory: t.Optional[str] = None, *, maxsize: int = 128):
+        self.directory = directory
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._digests: t.OrderedDict[str, None] = OrderedDict()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def digest(spec) -> str:
+        content = json.dumps(
+            spec,
+            sort_keys=True,
+            separators=(",", ":"),
+            ensure_ascii=False,
+            default=repr,
+        )
+        from openapi_spec_validator import __version__ as validator_version
+
+        h = hashlib.sha256(("%s\n" % validator_version).encode())
+        h.update(content.encode())
+        return h.hexdigest()
+
+    def __contains__(self, digest: str) -> bool:
+        if digest in self._digests:
+            self._digests.move_to_end(digest)
+            return True
+        if self.directory is not None:
+            path = os.path.join(self.directory, digest)
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                return False
+            self._remember(digest)
+            return True
+        return False
+
+    def add(self, digest: str) -> None:
+        self._remember(digest)
+        if self.directory is not None:
+            with open(os.path.join(self.directory, digest), "w"):
+                pass
+            self._evict_files()
+
+    def _remember(self, digest: str) -> None:
+        self._digests[digest] = None
+        self._digests.move_to_end(digest)
+        while len(self._digests) > self.maxsize:
+            self._digests.popitem(last=False)
+
+    def _evict_files(self) -> None:
+        # 只淘汰本缓存的记录，目录中的其他文件和子目录保持不变
+        assert self.directory is not None
+        entries = sorted(
+            (
+                e
+                for e in os.scandir(self.directory)
+                if _digest_name.fullmatch(e.name) and e.is_file()
+            ),
+            key=lambda e: e.stat().st_mtime,
+        )
+        for entry in entries[: max(len(entries) - self.maxsize, 0)]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:  # pragma: no cover
+                pass
+
+    def validate(self, spec) -> None:
+        digest = self.digest(spec)
+        if digest in self:
+            self.hits += 1
+            return
+        self.misses += 1
+        validate_spec(spec)
+        self.add(digest)
+
+
+class BuildStats:
+    """
+    记录一次 build() 的统计信息：各阶段耗时、按类型统计的节点数、
+    提升到 components 的数量以及展开后最大的 SchemaObject。timer 可以替换为自定义的计时函数。
+    """
+
+    def __init__(
+        self, *, largest: int = 10, timer: t.Callable[[], float] = time.perf_counter
+    ) -> None:
+        self.timer = timer
+        self.phases: t.Dict[str, float] = {}
+        self.nodes: t.Counter[str] = Counter()
+        self.components = 0
+        self.largest: t.List[t.Tuple[SchemaObject, int]] = []
+        self._largest = largest
+
+    @contextmanager
+    def phase(self, name: str):
+        start = self.timer()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + self.timer() - start
+
+    def record(self, traversal: Traversal, components: Components) -> None:
+        kinds = _kinds
+        # 展开后的节点数，被引用的 SchemaObject 只算一个节点
+        sizes: t.Dict[int, int] = {}
+        for node in traversal.order:
+            self.nodes[type(node).__name__] += 1
+            size = 1
+            for value in _iter_children(node):
+                if kinds[type(value)]:
+                    if traversal.is_reference(value):
+                        size += 1
+                    else:
+                        size += sizes.get(id(value), 1)
+            sizes[id(node)] = size
+
+        self.components = sum(len(values) for values in components.values())
+        self.largest = heapq.nlargest(
+            self._largest,
+            (
+                (node, sizes[id(node)])
+                for node in traversal.order
+                if isinstance(node, SchemaObject)
+            ),
+            key=lambda item: item[1],
+        )
+
+
+def _library_version() -> str:
+    from importlib import metadata
+
+    try:
+        return metadata.version("build_openapispec")
+    except metadata.PackageNotFoundError:  # pragma: no cover
+        return "unknown"
+
+
+def _stable_repr(name: str, value) -> str:
+    # 在各个进程中都相同的表示：函数和类用模块名和限定名，不能使用带有内存地址的 repr
+    qualname = getattr(value, "__qualname__", None)
+    if callable(value) and isinstance(qualname, str):
+        if "<" not in qualname:
+            return "%s.%s" % (value.__module__, qualname)
+    else:
+        rv = repr(value)
+        if " at 0x" not in rv:
+            return rv
+    raise ValueError(
+        "%s=%r can not be used in a cache key, "
+        "use a module-level function or class" % (name, value)
+    )
+
+
+class Snapshot:
+    """
+    把构建结果保存在 directory 中，以输入树的指纹、OpenAPI 版本、构建选项和库版本为 key。
+    其他进程（例如各个 gunicorn worker）用相同的树构建时直接读取结果，不再构建和校验；
+    树发生变化时 key 随之变化，最多保留 maxsize 个最近使用的快照。
+
+    文件的第一行是 JSON 格式的元数据，之后是紧凑 JSON 格式的文档。
+    """
+
+    def __init__(self, directory: str, *, maxsize: int = 8) -> None:
+        self.directory = directory
+        self.maxsize = maxsize
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, version: str, openapi, **options: t.Any) -> str:
+        h = hashlib.sha256()
+        for part in (_library_version(), version, fingerprint(openapi)):
+            h.update(("%s\n" % part).encode())
+        for name, value in sorted(options.items()):
+            h.update(("%s=%s\n" % (name, _stable_repr(name, value))).encode())
+        return h.hexdigest()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key + ".json")
+
+    def read(self, key: str) -> t.Optional[memoryview]:
+        """
+        以内存映射的方式返回文档的字节，多个进程共享同一份页面缓存，没有快照时返回 None。
+        """
+        try:
+            with open(self.path(key), "rb") as fp:
+                buffer = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+        try:
+            os.utime(self.path(key))
+        except FileNotFoundError:  # pragma: no cover
+            pass
+        return memoryview(buffer)[buffer.find(b"\n") + 1 :]
+
+    def load(self, key: str) -> t.Optional[dict]:
+        body = self.read(key)
+        if body is None:
+            return None
+        try:
+            return json.loads(bytes(body))
+        finally:
+            body.release()
+
+    def store(self, key: str, rv: dict) -> None:
+        meta = {"key": key, "library": _library_version(), "openapi": rv["openapi"]}
+        # 先写临时文件再替换，其他进程不会读到写了一半的快照
+        import tempfile
+
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                fp.write(json.dumps(meta).encode() + b"\n")
+                fp.write(
+                    json.dumps(rv, ensure_ascii=False, separators=(",", ":")).encode()
+                )
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+        self._evict()
+
+    def _evict(self) -> None:
+        entries = sorted(
+            (e for e in os.scandir(self.directory) if e.name.endswith(".json")),
+            key=lambda e: e.stat().st_mtime,
+        )
+        for entry in entries[: max(len(entries) - self.maxsize, 0)]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:  # pragma: no cover
+                pass
+
+
+def _phase(name: str, hook, stats: t.Optional[BuildStats]):
+    if hook is None:
+        return nullcontext() if stats is None else stats.phase(name)
+    if stats is None:
+        return hook(name)
+    return _nested(hook(name), stats.phase(name))
+
+
+@contextmanager
+def _nested(*managers):
+    with ExitStack() as stack:
+        for manager in managers:
+            stack.enter_context(manager)
+        yield
+
+
+def _resolved(value):
+    return value.resolve() if isinstance(value, Lazy) else value
+
+
+def _without(item, excluded: t.Tuple[str, ...]):
+    # 去掉部分操作的 path item，普通 dict 形式的 path item 保持原来的类型
+    fields = {k: v for k, v in item.items() if k not in excluded}
+    return item._evolve(fields) if isinstance(item, Schema) else type(item)(fields)
+
+
+def _subset(openapi, include, cache: t.Optional[t.Dict[t.Any, t.Any]] = None):
+    """
+    只保留 include(path, method, operation) 为真的操作，没有剩下任何操作的 path 被去掉。
+    返回新的根节点，其余部分与原文档共享。
+    """
+    paths = {}
+    for path, item in _resolved(openapi.get("paths", {})).items():
+        item = _resolved(item)
+        methods = [m for m in _methods if m in item]
+        excluded = tuple(m for m in methods if not include(path, m, _resolved(item[m])))
+        if not excluded:
+            paths[path] = item
+        elif len(excluded) < len(methods):
+            if cache is None:
+                paths[path] = _without(item, excluded)
+                continue
+            key = (id(item), excluded)
+            if key not in cache:
+                cache[key] = (item, _without(item, excluded))
+            paths[path] = cache[key][1]
+    return openapi._evolve(
+        {k: paths if k == "paths" else v for k, v in openapi.items()}
+    )
+
+
 def build(
-    version, openapi, /, *, validate: t.Literal["error", "warning", False] = "warning"
+    version,
+    openapi,
+    /,
+    *,
+    validate: t.Literal["error", "warning", False] = "warning",
+    validation_cache: t.Optional[ValidationCache] = None,
+    deduplicate: t.Optional[Deduplicate] = None,
+    hook: t.Optional[t.Callable[[str], t.ContextManager[t.Any]]] = None,
+    stats: t.Optional[BuildStats] = None,
+    include: t.Optional[t.Callable[[str, str, t.Any], bool]] = None,
+    validator: Validator = "full",
+    snapshot: t.Optional[Snapshot] = None,
+    interner: t.Optional[Interner] = None,
 ):
-    assert isinstance(openapi, Root)
+    """
+    validator 为 fast 时只检查各节点自身的规则（见 Schema.errors()），结果缓存在节点上，
+    完整的 openapi-spec-validator 校验可以只在 CI 中进行。validator 也可以是自定义的校验函数，
+    以构建结果调用，返回错误信息，例如接入编译好的 JSON Schema 校验器；
+    validation_cache 只用于 full。openapi-spec-validator 在第一次 full 校验时才导入。
+
+    hook 以阶段名（traverse、deduplicate、dumps、validate、intern）调用，返回包住该阶段的上下文管理器，
+    可用于接入自定义的计时或 tracing span；stats 收集本次构建的统计信息。
 
-    # schema count
-    ref_count = count_references(openapi)
+    include(path, method, operation) 为假的操作不会被遍历，引用计数和 components
+    只统计保留下来的部分。
+
+    指定 snapshot 时，相同的输入直接读取保存的结果，见 Snapshot。
+
+    指定 interner 时返回不可变的结果，内容相同的子树在多次构建之间共享，见 Interner。
+    """
+    assert isinstance(openapi, Root)
+    if include is not None:
+        if snapshot is not None:
+            raise ValueError("snapshot can not be used with include")
+        openapi = _subset(openapi, include)
+
+    if snapshot is not None:
+        with _phase("snapshot", hook, stats):
+            key = snapshot.key(
+                version,
+                openapi,
+                validate=validate,
+                validator=validator,
+                deduplicate=deduplicate and vars(deduplicate),
+            )
+            rv = snapshot.load(key)
+        if rv is not None:
+            return rv if interner is None else interner(rv)
+
+    with _phase("traverse", hook, stats):
+        traversal = Traversal(openapi)
+    if deduplicate is not None:
+        with _phase("deduplicate", hook, stats):
+            traversal = deduplicate(traversal)
 
     components = Components()
+    with _phase("dumps", hook, stats):
+        rv: dict = dumps(traversal, components, version=version)
+        rv["openapi"] = version
+        if components:
+            rv["components"] = _merge_components(rv.get("components"), components)
 
-    def dumps(data):
-        if isinstance(data, Mapping):
-            if isinstance(data, Schema):
-                # schema object
-                if isinstance(data, SchemaObject):
-                    if data.key and ref_count[data] > 1:
-                        components.setfield("schemas", data.key, dumps(dict(data)))
-                        return {"$ref": "#/components/schemas/%s" % data.key}
+    if validate:
+        with _phase("validate", hook, stats):
+            _run_validator(
+                rv,
+                lambda: _errors(traversal, version),
+                validate,
+                validator,
+                validation_cache,
+                stacklevel=3,
+            )
+
+    if stats is not None:
+        stats.record(traversal, components)
+    if snapshot is not None:
+        snapshot.store(key, rv)
+    if interner is not None:
+        with _phase("intern", hook, stats):
+            rv = interner(rv)
 
-                # security scheme
-                if isinstance(data, SecurityRequirementObject):
-                    scheme = data.scheme
-                    components.setfield("securitySchemes", scheme.key, dict(scheme))
+    return rv
 
-            return {k: dumps(v) for k, v in data.items()}
 
-        if isinstance(data, list):
-            return [dumps(v) for v in data]
+class _Block:
+    # 增量构建的序列化单元：一个 path、根对象除 paths 外的字段，或一个 SchemaObject 的内容
+    __slots__ = ("node", "role", "traversal", "schemas", "schemes", "output")
+
+    def __init__(self, node, role: str = "root") -> None:
+        self.node = node
+        self.role = role
+        self.traversal = Traversal(node, boundary=True)
+        self.schemas: t.Dict[SchemaObject, int] = dict(self.traversal.references)
+        if _kind(node) == SCHEMA_OBJECT:
+            # 去掉根节点自身的计数，只保留内容中的引用（包括对自身的引用）
+            self.schemas[node] -= 1
+            if not self.schemas[node]:
+                del self.schemas[node]
+        self.schemes = [
+            n.scheme
+            for n in self.traversal.order
+            if isinstance(n, SecurityRequirementObject)
+        ]
+        self.output: t.Any = None
+
+
+class BuildSession:
+    """
+    增量构建：保留上一次的结果，只重新序列化发生变化的 path，
+    以及因引用计数变化而需要在内联和 $ref 之间切换的 SchemaObject 所影响的部分。
+
+    各节点在加入会话后应视为不可变。
+    """
+
+    def __init__(
+        self,
+        version,
+        openapi,
+        /,
+        *,
+        validate: t.Literal["error", "warning", False] = "warning",
+        validation_cache: t.Optional[ValidationCache] = None,
+        validator: Validator = "full",
+    ) -> None:
+        assert isinstance(openapi, Root)
+        self.version = version
+        self.validate = validate
+        self.validation_cache = validation_cache
+        self.validator = validator
+        self._openapi = openapi
+
+        self._fields = list(openapi.keys())
+        self._root = {k: v for k, v in openapi.items() if k != "paths"}
+        self._paths: t.Dict[str, t.Any] = {
+            k: _resolved(v) for k, v in _resolved(openapi.get("paths", {})).items()
+        }
+        self._dirty: t.Dict[t.Optional[str], None] = dict.fromkeys([None, *self._paths])
+
+        self._units: t.Dict[t.Optional[str], _Block] = {}
+        self._bodies: t.Dict[SchemaObject, _Block] = {}
+        self._users: t.Dict[SchemaObject, t.Set[_Block]] = defaultdict(set)
+        # 来自各 path 和根对象的引用，以及来自可达 SchemaObject 内容的引用
+        self._direct: t.Counter[SchemaObject] = Counter()
+        self._nested: t.Counter[SchemaObject] = Counter()
+        self._schemes: t.Counter[SecuritySchemeObject] = Counter()
+        self._recursive: t.Set[SchemaObject] = set()
+        self._hoisted: t.Dict[SchemaObject, None] = {}
+
+        self._paths_output: t.Dict[str, t.Any] = {}
+
+    def set_path(self, path: str, item) -> None:
+        self._paths[path] = _resolved(item)
+        self._dirty[path] = None
+
+    def set_operation(self, path: str, method: str, operation) -> None:
+        item = self._paths.get(path)
+        fields = dict(item) if item is not None else {}
+        if operation is None:
+            fields.pop(method, None)
+        else:
+            fields[method] = operation
+        self.set_path(
+            path, (type(item) if item is not None else PathItemObject)(fields)
+        )
 
-        return data
+    def remove_path(self, path: str) -> None:
+        del self._paths[path]
+        self._dirty[path] = None
+
+    def set_paths(self, paths: t.Mapping[str, t.Any]) -> None:
+        """
+        替换全部 path，输出中 path 的顺序与 paths 相同。只有新增、删除或节点发生变化的 path 需要重新处理。
+        """
+        paths = {k: _resolved(v) for k, v in paths.items()}
+        for path in self._paths.keys() - paths.keys():
+            self._dirty[path] = None
+        for path, item in paths.items():
+            if self._paths.get(path) is not item:
+                self._dirty[path] = None
+        self._paths = paths
+
+    def build(self) -> dict:
+        touched: t.Dict[SchemaObject, None] = {}
+        stale: t.Dict[_Block, None] = {}
+
+        # 1. 重新统计变化的 path
+        for key in self._dirty:
+            old = self._units.pop(key, None)
+            if old is not None:
+                touched.update(dict.fromkeys(self._detach(old, self._direct)))
+            if key is None:
+                node: t.Any = self._root
+            elif key in self._paths:
+                node = self._paths[key]
+            else:
+                self._paths_output.pop(key, None)
+                continue
+            block = self._units[key] = _Block(node, "root" if key is None else "path")
+            touched.update(dict.fromkeys(self._attach(block, self._direct)))
+            stale[block] = None
+        self._dirty.clear()
+
+        # 2. 更新可达的 SchemaObject
+        if any(s in self._bodies and not self._direct[s] for s in touched):
+            touched.update(self._prune())
+        added = self._reach([s for s in touched if self._direct[s]])
+        for s in added:
+            touched.update(dict.fromkeys(self._attach(self._bodies[s], self._nested)))
+            stale[self._bodies[s]] = None
+
+        # 3. 重新决定 SchemaObject 是内联还是转为 $ref
+        for s in touched:
+            hoisted = (
+                s in self._bodies
+                and bool(s.key)
+                and (self._direct[s] + self._nested[s] > 1 or s in self._recursive)
+            )
+            if hoisted == (s in self._hoisted):
+                continue
+            if hoisted:
+                self._hoisted[s] = None
+            else:
+                del self._hoisted[s]
+            stale.update(dict.fromkeys(self._users.get(s, ())))
+
+        # 内联的 SchemaObject 变化时，引用它的单元也需要重新序列化
+        queue = list(stale)
+        while queue:
+            block = queue.pop()
+            node = block.node
+            if _kind(node) == SCHEMA_OBJECT and node not in self._hoisted:
+                for user in self._users.get(node, ()):
+                    if user not in stale:
+                        stale[user] = None
+                        queue.append(user)
+
+        # 4. 按依赖顺序重新序列化
+        self._emit(stale)
+        for key, block in self._units.items():
+            if key is not None and block in stale:
+                self._paths_output[key] = block.output
+
+        return self._assemble(stacklevel=3)
+
+    def _attach(self, block: _Block, counter: t.Counter[SchemaObject]):
+        for s, n in block.schemas.items():
+            counter[s] += n
+            self._users[s].add(block)
+        self._schemes.update(block.schemes)
+        return block.schemas.keys()
+
+    def _detach(self, block: _Block, counter: t.Counter[SchemaObject]):
+        for s, n in block.schemas.items():
+            counter[s] -= n
+            if not counter[s]:
+                del counter[s]
+            self._users[s].discard(block)
+            if not self._users[s]:
+                del self._users[s]
+        self._schemes.subtract(block.schemes)
+        return block.schemas.keys()
+
+    def _reach(self, roots: t.List[SchemaObject]) -> t.List[SchemaObject]:
+        added = []
+        stack = [s for s in roots if s not in self._bodies]
+        while stack:
+            s = stack.pop()
+            if s in self._bodies:
+                continue
+            block = self._bodies[s] = _Block(s)
+            added.append(s)
+            stack.extend(c for c in block.schemas if c not in self._bodies)
+
+        if added:
+            # 新加入的 SchemaObject 不会与已有的构成环，只需检查它们自身
+            self._recursive.update(Traversal(added).recursive)
+        return added
+
+    def _prune(self) -> t.Dict[SchemaObject, None]:
+        reachable: t.Set[SchemaObject] = set()
+        stack = list(self._direct)
+        while stack:
+            s = stack.pop()
+            if s in reachable or s not in self._bodies:
+                continue
+            reachable.add(s)
+            stack.extend(self._bodies[s].schemas)
+
+        touched: t.Dict[SchemaObject, None] = {}
+        removed = [s for s in self._bodies if s not in reachable]
+        for s in removed:
+            touched.update(
+                dict.fromkeys(self._detach(self._bodies.pop(s), self._nested))
+            )
+            self._hoisted.pop(s, None)
+            self._recursive.discard(s)
+        touched.update(dict.fromkeys(removed))
+        return touched
+
+    def _reference(self, s: SchemaObject):
+        if s in self._hoisted:
+            return _reference(s, s.key)
+        return self._bodies[s].output
+
+    def _emit(self, stale: t.Dict[_Block, None]) -> None:
+        convert = _convert(self.version) is not None
+        done: t.Set[_Block] = set()
+        for block in stale:
+            stack = [block]
+            while stack:
+                b = stack[-1]
+                if b in done:
+                    stack.pop()
+                    continue
+                children = [
+                    self._bodies[c]
+                    for c in b.schemas
+                    if c not in self._hoisted
+                    and self._bodies[c] in stale
+                    and self._bodies[c] not in done
+                ]
+                if children:
+                    stack.extend(children)
+                    continue
+                stack.pop()
+                dumped = {id(c): self._reference(c) for c in b.schemas}
+                b.output = dumps(
+                    b.traversal,
+                    Components(),
+                    dumped,
+                    version=self.version,
+                    plain=_plain_schemas(b.traversal, b.role) if convert else None,
+                )
+                done.add(b)
+
+    def _assemble(self, *, stacklevel: int) -> dict:
+        root = self._units[None].output
+        rv = {}
+        paths = {k: self._paths_output[k] for k in self._paths}
+        for k in self._fields:
+            rv[k] = paths if k == "paths" else root[k]
+        if "paths" not in rv and paths:
+            rv["paths"] = paths
+        rv["openapi"] = self.version
+
+        components = Components()
+        for s in self._hoisted:
+            components.setfield(type(s).__component__, s.key, self._bodies[s].output)
+        for scheme, n in self._schemes.items():
+            if n > 0:
+                components.setfield("securitySchemes", scheme.key, dict(scheme))
+        if components:
+            rv["components"] = _merge_components(rv.get("components"), components)
+
+        if self.validate:
+            _run_validator(
+                rv,
+                self._errors,
+                self.validate,
+                self.validator,
+                self.validation_cache,
+                stacklevel=stacklevel + 1,
+            )
+        return rv
+
+    def _errors(self) -> t.List[str]:
+        # fast 校验：根对象以及各单元中的节点，每个节点的结果缓存在节点上
+        fields = {
+            k: self._paths if k == "paths" else self._root[k] for k in self._fields
+        }
+        if "paths" not in fields and self._paths:
+            fields["paths"] = self._paths
+        rv = list(self._openapi._evolve(fields).errors(self.version))
+        for block in (*self._units.values(), *self._bodies.values()):
+            rv.extend(_errors(block.traversal, self.version))
+        return rv
+
+
+def build_versions(
+    openapi,
+    versions: t.Sequence[str],
+    /,
+    *,
+    validate: t.Literal["error", "warning", False] = "warning",
+    validation_cache: t.Optional[ValidationCache] = None,
+    deduplicate: t.Optional[Deduplicate] = None,
+    interner: t.Optional[Interner] = None,
+    validator: Validator = "full",
+) -> t.Dict[str, dict]:
+    """
+    一次遍历构建多个目标版本的文档，例如 ["3.0.3", "3.1.0"]。引用计数只统计一次，
+    与版本无关的子树只序列化一次，各版本的结果之间共享这部分 dict。
+    interner 和 validator 与 build() 相同。
+    """
+    assert isinstance(openapi, Root)
+    for version in versions:
+        assert version in _versions, version
+
+    traversal = Traversal(openapi)
+    if deduplicate is not None:
+        traversal = deduplicate(traversal)
+
+    plain = _plain_schemas(traversal)
+    shared: t.Optional[t.Dict[int, t.Any]] = None
+    rv = {}
+    for version in versions:
+        components = Components()
+        if shared is None:
+            bodies: t.Dict[int, t.Any] = {}
+            document = dumps(
+                traversal, components, version=version, bodies=bodies, plain=plain
+            )
+            versioned = _versioned(traversal, plain)
+            shared = {k: v for k, v in bodies.items() if k not in versioned}
+        else:
+            document = dumps(
+                traversal, components, version=version, reuse=shared, plain=plain
+            )
+        # 根对象的结果可能是共享的，在副本上设置版本和 components
+        document = dict(document)
+        document["openapi"] = version
+        if components:
+            document["components"] = _merge_components(
+                document.get("components"), components
+            )
+        if validate:
+            _run_validator(
+                document,
+                lambda: _errors(traversal, version),
+                validate,
+                validator,
+                validation_cache,
+                stacklevel=3,
+            )
+        rv[version] = document if interner is None else interner(document)
+    return rv
 
-    rv: dict = dumps(openapi)  # type: ignore
-    rv["openapi"] = version
-    if components:
-        rv["components"] = dict(components)
 
-    if validate:
-        try:
+def build_variants(
+    version,
+    openapi,
+    variants: t.Mapping[str, t.Callable[[str, str, t.Any], bool]],
+    /,
+    *,
+    validate: t.Literal["error", "warning", False] = "warning",
+    validation_cache: t.Optional[ValidationCache] = None,
+    validator: Validator = "full",
+) -> t.Dict[str, dict]:
+    """
+    按 variants 中的每个 include 条件构建一份子集文档，结果与 build(include=...) 相等
+    （components 中的顺序可能不同）。
+
+    各子集在同一个 BuildSession 中依次构建，只有与上一个子集不同的 path，
+    以及内联 / $ref 发生变化的 SchemaObject 需要重新处理。各结果之间共享未变化的部分。
+    """
+    assert isinstance(openapi, Root)
+    cache: t.Dict[t.Any, t.Any] = {}
+    session: t.Optional[BuildSession] = None
+    rv = {}
+    for name, include in variants.items():
+        subset = _subset(openapi, include, cache)
+        paths = subset.get("paths", {})
+        if session is None:
+            session = BuildSession(
+                version,
+                subset,
+                validate=validate,
+                validation_cache=validation_cache,
+                validator=validator,
+            )
+        else:
+            session.set_paths(paths)
+        rv[name] = session.build()
+    return rv
+
+
+def _errors(traversal: Traversal, version: str) -> t.List[str]:
+    rv = []
+    for node in traversal.order:
+        if isinstance(node, Schema):
+            rv.extend(node.errors(version))
+    return rv
+
+
+def check(version: str, openapi, /) -> t.List[str]:
+    """
+    按目标版本对文档中的每个节点检查其自身的规则，返回错误信息。每个节点只检查一次。
+    """
+    return _errors(Traversal(openapi), version)
+
+
+def validate_spec(spec) -> None:
+    # openapi-spec-validator 及其依赖导入较慢，第一次校验时才导入
+    from openapi_spec_validator import validate
+
+    validate(spec)
+
+
+def _report(errors: t.List[str], validate, *, stacklevel):
+    if not errors:
+        return
+    message = "\n".join(errors)
+    if validate == "warning":
+        warnings.warn(message, stacklevel=stacklevel)
+    elif validate == "error":
+        from openapi_spec_validator.validation.exceptions import OpenAPIValidationError
+
+        raise OpenAPIValidationError(message)
+    else:
+        raise ValueError("Invalid validation mode: %r" % validate)  # pragma: no cover
+
+
+def _run_validator(
+    rv,
+    errors: t.Callable[[], t.List[str]],
+    validate,
+    validator: Validator,
+    validation_cache: t.Optional[ValidationCache],
+    *,
+    stacklevel: int,
+) -> None:
+    # 按 validator 校验构建结果，errors 返回 fast 校验的错误信息
+    if validator == "fast":
+        _report(errors(), validate, stacklevel=stacklevel + 1)
+    elif validator == "full":
+        _validate(rv, validate, validation_cache, stacklevel=stacklevel + 1)
+    else:
+        _report(list(validator(rv)), validate, stacklevel=stacklevel + 1)
+
+
+def _validate(rv, validate, validation_cache, *, stacklevel):
+    from openapi_spec_validator.validation.exceptions import OpenAPIValidationError
+
+    try:
+        if validation_cache is None:
             validate_spec(rv)
-        except OpenAPIValidationError as e:
-            if validate == "warning":
-                warnings.warn(str(e), stacklevel=2)
-            elif validate == "error":
-                raise
-            else:
-                raise ValueError(
-                    "Invalid validation mode: %r" % validate
-                )  # pragma: no cover
+        else:
+            validation_cache.validate(rv)
+    except OpenAPIValidationError as e:
+        if validate == "warning":
+            warnings.warn(str(e), stacklevel=stacklevel)
+        elif validate == "error":
+            raise
+        else:
+            raise ValueError(
+                "Invalid validation mode: %r" % validate
+            )  # pragma: no cover
+
+
+class BuildArtifact:
+    """
+    一次构建得到的 HTTP 响应内容：紧凑 JSON、预压缩的 gzip / deflate 版本和强 ETag。
+    """
+
+    content_type = "application/json"
+
+    def __init__(self, body: bytes) -> None:
+        self.body = body
+        self.length = len(body)
+        import gzip
+
+        self.gzip = gzip.compress(body, compresslevel=9, mtime=0)
+        self.deflate = zlib.compress(body, 9)
+        self.etag = '"%s"' % hashlib.sha256(body).hexdigest()[:40]
+
+    def not_modified(self, if_none_match: t.Optional[str]) -> bool:
+        # If-None-Match 使用弱比较
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag.startswith("W/"):
+                tag = tag[2:]
+            if tag == self.etag:
+                return True
+        return False
+
+    def encode(
+        self, accept_encoding: t.Optional[str]
+    ) -> t.Tuple[bytes, t.Optional[str]]:
+        # 返回响应体和 Content-Encoding
+        accepted = set()
+        for item in (accept_encoding or "").split(","):
+            coding, _, params = item.strip().partition(";")
+            q = params.strip()
+            if q.startswith("q="):
+                try:
+                    if float(q[2:]) <= 0:
+                        continue
+                except ValueError:
+                    continue
+            accepted.add(coding.strip().lower())
+        for coding in ("gzip", "deflate"):
+            if coding in accepted or "*" in accepted:
+                return getattr(self, coding), coding
+        return self.body, None
+
+
+class ArtifactBuilder:
+    """
+    构建并缓存 BuildArtifact，同一个根对象只构建一次。各节点在构建后应视为不可变。
+    线程安全，并发的相同请求合并为一次构建（见 CachedBuilder）。
+    """
+
+    def __init__(self, version: str, *, maxsize: int = 8) -> None:
+        self.version = version
+        self.maxsize = maxsize
+        self._cache: t.OrderedDict[t.Any, t.Tuple[t.Any, BuildArtifact]] = OrderedDict()
+        self._flights: t.Dict[t.Any, _Flight] = {}
+        self._lock = threading.Lock()
+
+    def __call__(
+        self,
+        openapi,
+        /,
+        *,
+        validate: t.Literal["error", "warning", False] = "warning",
+        validation_cache: t.Optional[ValidationCache] = None,
+        validator: Validator = "full",
+    ) -> BuildArtifact:
+        key = (id(openapi), validate, validator)
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None and cached[0] is openapi:
+                self._cache.move_to_end(key)
+                return cached[1]
+            # 构建中的根对象被 leader 持有，id 不会被复用
+            flight = self._flights.get(key)
+            leader = flight is None
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
 
+        try:
+            rv = build(self.version, openapi, validate=False)
+            if validate:
+                _run_validator(
+                    rv,
+                    lambda: check(self.version, openapi),
+                    validate,
+                    validator,
+                    validation_cache,
+                    stacklevel=3,
+                )
+            flight.result = BuildArtifact(
+                json.dumps(rv, ensure_ascii=False, separators=(",", ":")).encode()
+            )
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+                if flight.error is None:
+                    # 缓存中保留根对象，保证 id 不会被复用
+                    self._cache[key] = (openapi, flight.result)
+                    while len(self._cache) > self.maxsize:
+                        self._cache.popitem(last=False)
+            flight.event.set()
+        return flight.result
+
+    def cache_clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+
+class FrozenDict(dict):
+    """
+    不可修改的 dict，可以直接用 json 序列化。
+    """
+
+    __slots__ = ()
+
+    def _immutable(self, *args: t.Any, **kwargs: t.Any) -> t.NoReturn:
+        raise TypeError("%s is immutable" % type(self).__name__)
+
+    __setitem__ = __delitem__ = __ior__ = _immutable  # type: ignore
+    clear = pop = popitem = setdefault = update = _immutable  # type: ignore
+
+    def __reduce__(self):
+        return type(self), (dict(self),)
+
+
+def freeze(value, memo: t.Optional[t.Dict[int, t.Any]] = None):
+    """
+    把构建结果转换为 FrozenDict 和 tuple，共享的子树只转换一次。
+    """
+    if memo is None:
+        memo = {}
+    tp = type(value)
+    if tp is not dict and tp is not list:
+        return value
+    if id(value) in memo:
+        return memo[id(value)]
+    if tp is dict:
+        rv: t.Any = FrozenDict((k, freeze(v, memo)) for k, v in value.items())
+    else:
+        rv = tuple(freeze(v, memo) for v in value)
+    memo[id(value)] = rv
     return rv
 
 
+def _content_key(value):
+    # 已经驻留的 FrozenDict 和 tuple 按对象区分；-0.0 与 0.0、1 与 True 序列化后不同，不能合并
+    tp = type(value)
+    if tp is FrozenDict or tp is tuple:
+        return id(value)
+    if tp is float:
+        return tp, repr(value)
+    try:
+        hash(value)
+    except TypeError:
+        return object, id(value)
+    return tp, value
+
+
+class Interner:
+    """
+    把构建结果转换为 FrozenDict 和 tuple，并按内容驻留：内容相同的子树（同一次构建中的多处出现，
+    或多次构建之间没有变化的部分）得到同一个对象。同时保留多个构建结果时，占用的内存只与不同的内容有关。
+
+    驻留的对象一直保留，直到 clear()。可以在多个线程之间共享。
+    """
+
+    def __init__(self) -> None:
+        self._pool: t.Dict[t.Tuple[t.Any, ...], t.Any] = {}
+        self._interned: t.Set[int] = set()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._pool)
+
+    def __call__(self, value):
+        with self._lock:
+            return self._intern(value, {})
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pool.clear()
+            self._interned.clear()
+
+    def _intern(self, value, memo: t.Dict[int, t.Any]):
+        pool = self._pool
+        interned = self._interned
+
+        def intern(value):
+            tp = type(value)
+            if tp is dict or tp is FrozenDict:
+                is_dict = True
+            elif tp is list or tp is tuple:
+                is_dict = False
+            else:
+                return value
+            # 已经驻留的子树不再遍历
+            if id(value) in interned:
+                return value
+            rv = memo.get(id(value))
+            if rv is not None:
+                return rv
+            if is_dict:
+                items = [(k, intern(v)) for k, v in value.items()]
+                key = (dict, *[(k, _content_key(v)) for k, v in items])
+            else:
+                items = [intern(v) for v in value]
+                key = (list, *[_content_key(v) for v in items])
+            rv = pool.get(key)
+            if rv is None:
+                rv = pool[key] = FrozenDict(items) if is_dict else tuple(items)
+                interned.add(id(rv))
+            memo[id(value)] = rv
+            return rv
+
+        return intern(value)
+
+
+class _Flight:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.result: t.Any = None
+        self.error: t.Optional[BaseException] = None
+
+
+class CachedBuilder:
+    """
+    线程安全地缓存最近一次的构建结果。并发的 get() 合并为一次构建（single-flight），
+    所有等待者得到同一个不可变的结果（见 freeze()）。invalidate() 之后的 get() 重新构建，
+    进行中的构建结果不会被缓存。
+    """
+
+    def __init__(self, version: str, openapi, /, **options: t.Any) -> None:
+        self.version = version
+        self.openapi = openapi
+        self.options = options
+        self._lock = threading.Lock()
+        self._result: t.Any = None
+        self._flight: t.Optional[_Flight] = None
+
+    def get(self) -> FrozenDict:
+        result = self._result
+        if result is not None:
+            return result
+
+        with self._lock:
+            if self._result is not None:
+                return self._result
+            flight = self._flight
+            leader = flight is None
+            if flight is None:
+                flight = self._flight = _Flight()
+            openapi = self.openapi
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = freeze(build(self.version, openapi, **self.options))
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                if self._flight is flight:
+                    self._flight = None
+                    self._result = flight.result
+            flight.event.set()
+        return flight.result
+
+    def invalidate(self, openapi=None) -> None:
+        """
+        丢弃缓存的结果，指定 openapi 时同时替换要构建的文档。
+        """
+        with self._lock:
+            if openapi is not None:
+                self.openapi = openapi
+            self._result = None
+            self._flight = None
+
+
+_versions = ("3.0.3", "3.1.0")
+
+
 def openapispec(version: str, /):
-    assert version in ("3.0.3",)
+    assert version in _versions
     return OpenAPISpecNamespace(
         version=version,
         OpenAPIObject=OpenAPIObject,
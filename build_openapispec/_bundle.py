@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import re
+import typing as t
+
+from ._base import Root, _methods, build
+
+# 组件文件和 path 文件的文件名中带有内容的哈希
+_hashed = re.compile(r"[A-Za-z0-9._-]+\.[0-9a-f]{12}\.json")
+_unsafe = re.compile(r"[^A-Za-z0-9._-]")
+
+
+class Bundle(t.NamedTuple):
+    """
+    root 是入口文档的文件名，components 是组件文件的文件名（没有组件时为 None），
+    paths 为每个分组的 path 文件名，written 是本次实际写入的文件。均为相对于目录的路径。
+    """
+
+    root: str
+    components: t.Optional[str]
+    paths: t.Dict[str, str]
+    written: t.List[str]
+
+
+def _by_tag(path: str, item: t.Mapping[str, t.Any]) -> str:
+    for method in _methods:
+        operation = item.get(method)
+        if isinstance(operation, dict) and operation.get("tags"):
+            return operation["tags"][0]
+    return "default"
+
+
+def _by_prefix(path: str, item: t.Mapping[str, t.Any]) -> str:
+    return path.strip("/").split("/", 1)[0] or "default"
+
+
+def _pointer(name: str) -> str:
+    return name.replace("~", "~0").replace("/", "~1")
+
+
+def _relink(value, target: str, memo: t.Dict[int, t.Any]):
+    # 把指向 components 的 $ref 改为指向组件文件，共享的子树只复制一次。
+    # securitySchemes 按名称引用，留在入口文档中
+    if isinstance(value, list):
+        if id(value) not in memo:
+            memo[id(value)] = [_relink(v, target, memo) for v in value]
+        return memo[id(value)]
+    if not isinstance(value, dict):
+        return value
+    if id(value) not in memo:
+        ref = value.get("$ref")
+        if isinstance(ref, str) and ref.startswith("#/components/"):
+            memo[id(value)] = dict(value, **{"$ref": target + ref})
+        else:
+            memo[id(value)] = {k: _relink(v, target, memo) for k, v in value.items()}
+    return memo[id(value)]
+
+
+def _encode(value) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def _hashed_name(prefix: str, body: bytes) -> str:
+    return "%s.%s.json" % (prefix, hashlib.sha256(body).hexdigest()[:12])
+
+
+def _write(directory: str, name: str, body: bytes, written: t.List[str]) -> None:
+    # 内容相同的文件不再写入，保留原有的修改时间
+    path = os.path.join(directory, name)
+    try:
+        with open(path, "rb") as fp:
+            if fp.read() == body:
+                return
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as fp:
+        fp.write(body)
+    os.replace(tmp, path)
+    written.append(name)
+
+
+def build_bundle(
+    version,
+    openapi,
+    directory: str,
+    /,
+    *,
+    split: t.Union[
+        t.Literal["tag", "prefix"], t.Callable[[str, t.Mapping[str, t.Any]], str]
+    ] = "tag",
+    root: str = "openapi.json",
+    prune: bool = False,
+    **options: t.Any,
+) -> Bundle:
+    """
+    把 build() 的结果写成多个文件：入口文档、每组 path 一个文件、一个组件文件，
+    之间用相对的外部 $ref 连接，使用方可以只读取需要的部分。其他参数与 build() 相同，校验在拆分前进行。
+
+    split 为 tag 时按 path 中第一个操作的第一个 tag 分组，为 prefix 时按路径的第一段分组，
+    也可以是 split(path, item) 返回组名的函数。组件文件和 path 文件以内容的哈希命名，
+    内容不变的文件不会被重写（组件变化时，引用组件的 path 文件也随之改名）；
+    prune 为真时删除目录中不再使用的带哈希的文件。
+    """
+    assert isinstance(openapi, Root)
+    if split == "tag":
+        group = _by_tag
+    elif split == "prefix":
+        group = _by_prefix
+    elif callable(split):
+        group = split
+    else:
+        raise ValueError("Invalid split: %r" % (split,))
+
+    rv = build(version, openapi, **options)
+    written: t.List[str] = []
+
+    # securitySchemes 由 security 按名称引用，必须留在入口文档中
+    components = dict(rv.get("components", {}))
+    schemes = components.pop("securitySchemes", None)
+    components_name = None
+    if components:
+        body = _encode({"components": components})
+        components_name = _hashed_name("components", body)
+        _write(directory, components_name, body, written)
+
+    groups: t.Dict[str, t.Dict[str, t.Any]] = {}
+    for path, item in rv.get("paths", {}).items():
+        groups.setdefault(_unsafe.sub("_", group(path, item)), {})[path] = item
+
+    memo: t.Dict[int, t.Any] = {}
+    paths: t.Dict[str, str] = {}
+    refs: t.Dict[str, t.Any] = {}
+    for name, items in groups.items():
+        body = _encode(_relink(items, "../%s" % components_name, memo))
+        paths[name] = "paths/" + _hashed_name(name, body)
+        _write(directory, paths[name], body, written)
+        for path in items:
+            refs[path] = {"$ref": "%s#/%s" % (paths[name], _pointer(path))}
+
+    # 入口文档与组件文件在同一个目录中，$ref 的前缀不同，不能共用 memo
+    memo = {}
+    document: t.Dict[str, t.Any] = {}
+    for k, v in rv.items():
+        if k == "paths":
+            document[k] = {path: refs[path] for path in v}
+        elif k != "components":
+            document[k] = (
+                v if components_name is None else _relink(v, components_name, memo)
+            )
+    if schemes:
+        document["components"] = {"securitySchemes": schemes}
+    _write(directory, root, _encode(document), written)
+
+    if prune:
+        keep = {components_name, *paths.values()}
+        for folder in (directory, os.path.join(directory, "paths")):
+            if not os.path.isdir(folder):
+                continue
+            for entry in os.scandir(folder):
+                name = os.path.relpath(entry.path, directory).replace(os.sep, "/")
+                if _hashed.fullmatch(entry.name) and name not in keep:
+                    os.remove(entry.path)
+
+    return Bundle(root, components_name, paths, written)
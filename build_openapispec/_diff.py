@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import typing as t
+from itertools import zip_longest
+
+from ._base import (
+    SCHEMA_OBJECT,
+    Traversal,
+    _iter_children,
+    _kind,
+    _kinds,
+    _methods,
+    _resolved,
+    fingerprint,
+)
+
+
+class Changes(t.NamedTuple):
+    added: t.List[t.Any]
+    removed: t.List[t.Any]
+    changed: t.List[t.Any]
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+
+class SpecDiff(t.NamedTuple):
+    """
+    paths 中是 path，operations 中是 (path, method)，
+    components 中是 (components 字段, key)，例如 ("schemas", key)。
+    """
+
+    paths: Changes
+    operations: Changes
+    components: Changes
+
+    def __bool__(self) -> bool:
+        return bool(self.paths or self.operations or self.components)
+
+
+def _compare(
+    old: t.Mapping, new: t.Mapping, keys: t.Optional[t.Iterable[t.Any]] = None
+):
+    added, removed, changed = [], [], []
+    for k in old if keys is None else keys:
+        if k not in old:
+            continue
+        if k not in new:
+            removed.append(k)
+        elif _fingerprint(old[k]) != _fingerprint(new[k]):
+            changed.append(k)
+    for k in new if keys is None else keys:
+        if k in new and k not in old:
+            added.append(k)
+    return added, removed, changed
+
+
+def _fingerprint(value) -> t.Any:
+    return fingerprint(value) if _kinds[type(value)] else ("scalar", repr(value))
+
+
+class _Schemas:
+    # 在发生变化的子树中收集有 key 的 SchemaObject（以及 parameter 等可复用的对象），
+    # 内容相同的子树直接跳过。Lazy 在取出时求值，只出现在一侧的子树中也不会遇到 Lazy
+    def __init__(self) -> None:
+        self.old: t.Dict[t.Tuple[str, str], str] = {}
+        self.new: t.Dict[t.Tuple[str, str], str] = {}
+
+    def pair(self, old, new) -> None:
+        stack = [(old, new)]
+        while stack:
+            a, b = map(_resolved, stack.pop())
+            if a is not None and b is not None and _fingerprint(a) == _fingerprint(b):
+                continue
+            deeper_a = self._visit(a, self.old)
+            deeper_b = self._visit(b, self.new)
+            if deeper_a and deeper_b and isinstance(a, list) == isinstance(b, list):
+                if isinstance(a, list):
+                    stack.extend(zip_longest(a, b))
+                else:
+                    stack.extend((a.get(k), b.get(k)) for k in dict.fromkeys([*a, *b]))
+                continue
+            if deeper_a:
+                stack.extend((v, None) for v in _iter_children(a))
+            if deeper_b:
+                stack.extend((None, v) for v in _iter_children(b))
+
+    @staticmethod
+    def _visit(node, found: t.Dict[t.Tuple[str, str], str]) -> bool:
+        # 返回是否需要继续深入，同一个 key 只深入一次
+        kind = _kind(node)
+        if not kind:
+            return False
+        if kind == SCHEMA_OBJECT and node.key:
+            key = (type(node).__component__, node.key)
+            if key in found:
+                return False
+            found[key] = fingerprint(node)
+        return True
+
+
+def diff(old, new) -> SpecDiff:
+    """
+    比较两个文档，只深入指纹不同的子树，耗时与变化的大小成正比。
+
+    components 只比较变化的子树中出现的有 key 的 SchemaObject 和可复用的对象：
+    同一个 key 的内容不同时记为 changed；只出现在一侧时才检查另一侧的整个文档，
+    确定是否为 added / removed。
+    """
+    old_paths = _resolved(old.get("paths", {}))
+    new_paths = _resolved(new.get("paths", {}))
+    paths = Changes(*_compare(old_paths, new_paths))
+
+    operations = Changes([], [], [])
+    for path in paths.added:
+        item = _resolved(new_paths[path])
+        operations.added.extend((path, m) for m in _methods if m in item)
+    for path in paths.removed:
+        item = _resolved(old_paths[path])
+        operations.removed.extend((path, m) for m in _methods if m in item)
+    for path in paths.changed:
+        a, b = _resolved(old_paths[path]), _resolved(new_paths[path])
+        methods = [m for m in _methods if m in a or m in b]
+        for field, items in zip(operations, _compare(a, b, methods)):
+            field.extend((path, m) for m in items)
+
+    schemas = _Schemas()
+    for path in paths.added:
+        schemas.pair(None, new_paths[path])
+    for path in paths.removed:
+        schemas.pair(old_paths[path], None)
+    for path in paths.changed:
+        schemas.pair(old_paths[path], new_paths[path])
+    for k in {**old, **new}:
+        if k != "paths":
+            schemas.pair(old.get(k), new.get(k))
+
+    components = Changes([], [], [])
+    only_new = schemas.new.keys() - schemas.old.keys()
+    only_old = schemas.old.keys() - schemas.new.keys()
+    old_all = _all_schemas(old) if only_new else {}
+    new_all = _all_schemas(new) if only_old else {}
+    for key, value in schemas.new.items():
+        if key in schemas.old:
+            if schemas.old[key] != value:
+                components.changed.append(key)
+        elif key not in old_all:
+            components.added.append(key)
+        elif old_all[key] != value:
+            components.changed.append(key)
+    for key in schemas.old:
+        if key in only_old:
+            if key not in new_all:
+                components.removed.append(key)
+            elif new_all[key] != schemas.old[key]:
+                components.changed.append(key)
+
+    return SpecDiff(paths, operations, components)
+
+
+def _all_schemas(root) -> t.Dict[t.Tuple[str, str], str]:
+    traversal = Traversal(root)
+    return {
+        (type(n).__component__, n.key): fingerprint(n)
+        for n in traversal.order
+        if _kind(n) == SCHEMA_OBJECT and n.key
+    }
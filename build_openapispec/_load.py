@@ -0,0 +1,340 @@
+from __future__ import annotations
+
+import json
+import typing as t
+
+from ._base import (
+    InfoObject,
+    Lazy,
+    MediaTypeObject,
+    OpenAPIObject,
+    OperationObject,
+    ParameterObject,
+    PathItemObject,
+    RequestBodyObject,
+    ResponseObject,
+    SchemaObject,
+    SecurityRequirementObject,
+    SecuritySchemeObject,
+    TagObject,
+    _methods,
+)
+
+# 可以转为有 key 的节点的 components 字段
+_keyed = {
+    "schemas": SchemaObject,
+    "parameters": ParameterObject,
+    "responses": ResponseObject,
+    "requestBodies": RequestBodyObject,
+}
+_ref_prefix = "#/components/"
+_schemas_prefix = _ref_prefix + "schemas/"
+
+
+def _parse(source) -> t.Dict[str, t.Any]:
+    if isinstance(source, dict):
+        return source
+    if isinstance(source, str):
+        with open(source, "rb") as fp:
+            return _parse_text(fp.read(), source.endswith(".json"))
+    return _parse_text(source.read(), False)
+
+
+def _parse_text(text: t.Union[str, bytes], is_json: bool) -> t.Dict[str, t.Any]:
+    if not is_json:
+        stripped = text.lstrip()
+        is_json = stripped[:1] in ("{", b"{")
+    if is_json:
+        return json.loads(text)
+
+    import yaml
+
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    return yaml.load(text, Loader=loader)
+
+
+def _schema_30(fields: t.Dict[str, t.Any]) -> None:
+    # 3.1 的类型联合和数值的 exclusiveMinimum / exclusiveMaximum 转为 3.0 的写法，
+    # 以 3.1 构建时再转换回去
+    types = fields.get("type")
+    if isinstance(types, list) and "null" in types and len(types) == 2:
+        (fields["type"],) = (v for v in types if v != "null")
+        fields["nullable"] = True
+        if isinstance(fields.get("enum"), list):
+            fields["enum"] = [v for v in fields["enum"] if v is not None]
+    for exclusive, bound in (
+        ("exclusiveMinimum", "minimum"),
+        ("exclusiveMaximum", "maximum"),
+    ):
+        value = fields.get(exclusive)
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            fields[bound] = value
+            fields[exclusive] = True
+
+
+class _Loader:
+    # 每个 components 中的对象只转换一次，所有 $ref 共享同一个节点
+    def __init__(self, data: t.Dict[str, t.Any], version: str) -> None:
+        self.json_schema = version.startswith("3.1.")
+        self.components: t.Dict[str, t.Any] = data.get("components") or {}
+        self.loaded: t.Dict[t.Tuple[str, str], t.Any] = {}
+        self.schemes: t.Dict[str, SecuritySchemeObject] = {}
+
+    def ref(self, value, convert: t.Callable[[t.Any], t.Any]):
+        # 指向 components 的 $ref 转为 Lazy，第一次遍历时得到共享的节点；其他 $ref 原样保留
+        ref = value["$ref"]
+        if not isinstance(ref, str) or not ref.startswith(_ref_prefix):
+            return value
+        field, _, name = ref[len(_ref_prefix) :].partition("/")
+        name = name.replace("~1", "/").replace("~0", "~")
+        if name not in self.components.get(field, {}):
+            return value
+        return Lazy(lambda: self.component(field, name, convert))
+
+    def component(self, field: str, name: str, convert: t.Callable[[t.Any], t.Any]):
+        key = (field, name)
+        if key not in self.loaded:
+            value = self.components[field][name]
+            cls = _keyed.get(field)
+            if cls is not None and isinstance(value, dict) and "$ref" not in value:
+                self.loaded[key] = convert(value, key=name)
+            else:
+                self.loaded[key] = convert(value)
+        return self.loaded[key]
+
+    def schema(self, value, *, key: t.Optional[str] = None):
+        if not isinstance(value, dict):
+            return value
+        if "$ref" in value:
+            return self.ref(value, self.schema)
+        fields = dict(value)
+        if self.json_schema:
+            _schema_30(fields)
+        for name in ("items", "not", "additionalProperties"):
+            if isinstance(fields.get(name), dict):
+                fields[name] = self.schema(fields[name])
+        for name in ("allOf", "anyOf", "oneOf"):
+            if isinstance(fields.get(name), list):
+                fields[name] = [self.schema(v) for v in fields[name]]
+        if isinstance(fields.get("properties"), dict):
+            fields["properties"] = {
+                k: self.schema(v) for k, v in fields["properties"].items()
+            }
+        return SchemaObject(fields, key=key)
+
+    def content(self, value):
+        if not isinstance(value, dict):
+            return value
+        return {
+            k: (
+                MediaTypeObject(
+                    self._with(v, schema=self.schema, encoding=self.encoding)
+                )
+                if isinstance(v, dict)
+                else v
+            )
+            for k, v in value.items()
+        }
+
+    def encoding(self, value):
+        if not isinstance(value, dict):
+            return value
+        return {
+            k: self._with(v, headers=self.headers) if isinstance(v, dict) else v
+            for k, v in value.items()
+        }
+
+    def header(self, value):
+        # 指向 components 中 header 的 $ref 原样保留，headers 随文档的 components 一起保留
+        if not isinstance(value, dict) or "$ref" in value:
+            return value
+        return self._with(value, schema=self.schema, content=self.content)
+
+    def headers(self, value):
+        if not isinstance(value, dict):
+            return value
+        return {k: self.header(v) for k, v in value.items()}
+
+    def parameter(self, value, *, key: t.Optional[str] = None):
+        if not isinstance(value, dict):
+            return value
+        if "$ref" in value:
+            return self.ref(value, self.parameter)
+        return ParameterObject(
+            self._with(value, schema=self.schema, content=self.content), key=key
+        )
+
+    def request_body(self, value, *, key: t.Optional[str] = None):
+        if not isinstance(value, dict):
+            return value
+        if "$ref" in value:
+            return self.ref(value, self.request_body)
+        return RequestBodyObject(self._with(value, content=self.content), key=key)
+
+    def response(self, value, *, key: t.Optional[str] = None):
+        if not isinstance(value, dict):
+            return value
+        if "$ref" in value:
+            return self.ref(value, self.response)
+        return ResponseObject(
+            self._with(value, content=self.content, headers=self.headers), key=key
+        )
+
+    def security(self, value):
+        # 只有一个 scheme 且没有 scope 的要求可以用 SecurityRequirementObject 表示
+        if not isinstance(value, list):
+            return value
+        rv = []
+        for requirement in value:
+            if isinstance(requirement, dict) and len(requirement) == 1:
+                ((name, scopes),) = requirement.items()
+                scheme = self.components.get("securitySchemes", {}).get(name)
+                if scopes == [] and isinstance(scheme, dict) and "$ref" not in scheme:
+                    if name not in self.schemes:
+                        self.schemes[name] = SecuritySchemeObject(scheme, key=name)
+                    requirement = SecurityRequirementObject(scheme=self.schemes[name])
+            rv.append(requirement)
+        return rv
+
+    def operation(self, value):
+        if not isinstance(value, dict):
+            return value
+        return OperationObject(
+            self._with(
+                value,
+                parameters=self.parameters,
+                requestBody=self.request_body,
+                responses=self.responses,
+                callbacks=self.callbacks,
+                security=self.security,
+            )
+        )
+
+    def callback(self, value):
+        if not isinstance(value, dict) or "$ref" in value:
+            return value
+        return {k: self.path_item(v) for k, v in value.items()}
+
+    def callbacks(self, value):
+        if not isinstance(value, dict):
+            return value
+        return {k: self.callback(v) for k, v in value.items()}
+
+    def parameters(self, value):
+        if not isinstance(value, list):
+            return value
+        return [self.parameter(v) for v in value]
+
+    def responses(self, value):
+        if not isinstance(value, dict):
+            return value
+        return {k: self.response(v) for k, v in value.items()}
+
+    def path_item(self, value):
+        if not isinstance(value, dict) or "$ref" in value:
+            return value
+        converters: t.Dict[str, t.Callable[[t.Any], t.Any]] = dict.fromkeys(
+            _methods, self.operation
+        )
+        converters["parameters"] = self.parameters
+        return PathItemObject(self._with(value, **converters))
+
+    def declared(self, data: t.Dict[str, t.Any]) -> t.Dict[str, t.Any]:
+        # 不转为节点的组件（securitySchemes、headers、examples、links、callbacks 等）
+        # 转换其中的 $ref 后保留在文档的 components 中，原样引用它们的 $ref 仍然有效。
+        # discriminator 的 mapping 按名称引用的 schema 也必须留在 components 中
+        converters: t.Dict[str, t.Callable[[t.Any], t.Any]] = {
+            "headers": self.header,
+            "callbacks": self.callback,
+            "pathItems": self.path_item,
+        }
+        rv: t.Dict[str, t.Any] = {}
+        mapped = self.mapped(data)
+        if mapped:
+            rv["schemas"] = {
+                name: Lazy(
+                    lambda name=name: self.component("schemas", name, self.schema)
+                )
+                for name in mapped
+            }
+        for field, values in self.components.items():
+            if field in _keyed:
+                continue
+            convert = converters.get(field)
+            if convert is not None and isinstance(values, dict):
+                values = {k: convert(v) for k, v in values.items()}
+            rv[field] = values
+        return rv
+
+    def mapped(self, data: t.Dict[str, t.Any]) -> t.List[str]:
+        schemas = self.components.get("schemas") or {}
+        names: t.Set[str] = set()
+        stack: t.List[t.Any] = [data]
+        while stack:
+            value = stack.pop()
+            if isinstance(value, dict):
+                discriminator = value.get("discriminator")
+                if isinstance(discriminator, dict) and isinstance(
+                    discriminator.get("mapping"), dict
+                ):
+                    for ref in discriminator["mapping"].values():
+                        # mapping 的值可以是 $ref，也可以是 schema 的名称
+                        if isinstance(ref, str) and ref.startswith(_schemas_prefix):
+                            ref = ref[len(_schemas_prefix) :]
+                            names.add(ref.replace("~1", "/").replace("~0", "~"))
+                        elif isinstance(ref, str):
+                            names.add(ref)
+                stack.extend(value.values())
+            elif isinstance(value, list):
+                stack.extend(value)
+        return [name for name in schemas if name in names]
+
+    def root(self, data: t.Dict[str, t.Any]) -> OpenAPIObject:
+        fields = {k: v for k, v in data.items() if k not in ("openapi", "components")}
+        if isinstance(fields.get("info"), dict):
+            fields["info"] = InfoObject(fields["info"])
+        if isinstance(fields.get("tags"), list):
+            fields["tags"] = [
+                TagObject(v) if isinstance(v, dict) else v for v in fields["tags"]
+            ]
+        if "security" in fields:
+            fields["security"] = self.security(fields["security"])
+        if isinstance(fields.get("paths"), dict):
+            # 每个 path 在第一次被遍历时才转换
+            fields["paths"] = {
+                path: Lazy(lambda item=item: self.path_item(item))
+                for path, item in fields["paths"].items()
+            }
+        if isinstance(fields.get("webhooks"), dict):
+            fields["webhooks"] = {
+                k: self.path_item(v) for k, v in fields["webhooks"].items()
+            }
+        components = self.declared(data)
+        if components:
+            fields["components"] = components
+        return OpenAPIObject(fields)
+
+    @staticmethod
+    def _with(value: t.Dict[str, t.Any], **converters: t.Callable[[t.Any], t.Any]):
+        return {k: converters[k](v) if k in converters else v for k, v in value.items()}
+
+
+def load(version: str, source, /) -> OpenAPIObject:
+    """
+    把已有的文档（dict、文件路径或文件对象，JSON 或 YAML）转为 Schema 树，build() 的逆操作。
+
+    指向 components 中 schemas、parameters、responses、requestBodies 的 $ref
+    转为有 key 的节点，同一个组件的所有引用共享同一个节点，构建时按引用计数重新决定是否使用 $ref。
+    没有被引用的这些组件不再保留。其他组件（securitySchemes、headers、examples、links、callbacks 等）
+    转换其中的 $ref 后保留在文档的 components 中，build() 时与提升的组件合并；
+    discriminator 的 mapping 引用的 schema 也保留在 components 中。每个 path 在第一次被遍历时才转换。
+    3.1 文档中 Schema 的类型联合（[X, "null"]）和数值的 exclusiveMinimum / exclusiveMaximum
+    转为 3.0 的写法保存在节点上。
+    """
+    data = _parse(source)
+    declared = str(data.get("openapi", ""))
+    if declared.rsplit(".", 1)[0] != version.rsplit(".", 1)[0]:
+        raise ValueError(
+            "Cannot load an OpenAPI %s document as %s" % (declared or "?", version)
+        )
+    return _Loader(data, version).root(data)
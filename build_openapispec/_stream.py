@@ -0,0 +1,301 @@
+from __future__ import annotations
+
+import io
+import json
+import re
+import typing as t
+from collections.abc import Mapping
+
+from ._base import (
+    LIST,
+    REUSABLE,
+    SCHEMA_OBJECT,
+    Components,
+    Root,
+    SchemaObject,
+    SecurityRequirementObject,
+    Traversal,
+    _convert,
+    _kind,
+    _kinds,
+    _plain_schemas,
+    _reference,
+    _versioned_fields,
+)
+
+# 事件类型
+START_MAP, END_MAP, START_LIST, END_LIST, KEY, SCALAR = range(6)
+
+
+def _components(traversal: Traversal) -> Components:
+    # 与 dumps 相同的注册顺序，值为待序列化的节点
+    components = Components()
+    for node in traversal.order:
+        if _kind(node) == SCHEMA_OBJECT and traversal.is_reference(node):
+            components.setfield(type(node).__component__, traversal.key(node), node)
+        elif isinstance(node, SecurityRequirementObject):
+            scheme = node.scheme
+            components.setfield("securitySchemes", scheme.key, scheme)
+    return components
+
+
+def _events(traversal: Traversal, version: str):
+    """
+    按 build() 结果的顺序产生事件，不构建完整的文档，内存占用只与树的深度有关。
+    """
+    root = traversal.root
+    substitute = traversal.substitute
+    convert = _convert(version)
+    plain = _plain_schemas(traversal) if convert is not None else set()
+    components = _components(traversal)
+
+    def walk(value, body=False):
+        kind = _kinds[type(value)]
+        if not kind:
+            yield SCALAR, value
+            return
+
+        stack: t.List[t.Any] = []
+
+        def enter(value, kind, body=False):
+            if substitute and kind == SCHEMA_OBJECT:
+                value = substitute.get(id(value), value)
+            if kind == REUSABLE:
+                kind = _kind(value)
+            if kind == SCHEMA_OBJECT and not body and traversal.is_reference(value):
+                yield START_MAP, None
+                yield KEY, "$ref"
+                yield SCALAR, _reference(value, traversal.key(value))["$ref"]
+                yield END_MAP, None
+            elif kind == LIST:
+                yield START_LIST, None
+                stack.append((END_LIST, iter(value)))
+            else:
+                if (
+                    convert is not None
+                    and (isinstance(value, SchemaObject) or id(value) in plain)
+                    and _versioned_fields(value)
+                ):
+                    value = convert(dict(value.items()))
+                yield START_MAP, None
+                stack.append((END_MAP, iter(value.items())))
+
+        yield from enter(value, kind, body)
+        while stack:
+            end, items = stack[-1]
+            for item in items:
+                if end == END_MAP:
+                    key, item = item
+                    yield KEY, key
+                kind = _kinds[type(item)]
+                if kind:
+                    yield from enter(item, kind)
+                    break
+                yield SCALAR, item
+            else:
+                stack.pop()
+                yield end, None
+
+    yield START_MAP, None
+    fields = list(root.keys())
+    for name in ("openapi", "components"):
+        if name not in fields:
+            fields.append(name)
+    for name in fields:
+        if name == "openapi":
+            yield KEY, name
+            yield SCALAR, version
+        elif name == "components" and components:
+            # 与 build() 相同，文档中声明的 components 与提升的组件合并，同名时使用提升的组件
+            declared = root.get("components")
+            if not isinstance(declared, Mapping):
+                declared = {}
+            yield KEY, name
+            yield START_MAP, None
+            for field in dict.fromkeys([*declared, *components]):
+                if field not in components:
+                    yield KEY, field
+                    yield from walk(declared[field])
+                    continue
+                values = components[field]
+                existing = declared.get(field)
+                if not isinstance(existing, Mapping):
+                    existing = {}
+                yield KEY, field
+                yield START_MAP, None
+                for key in dict.fromkeys([*existing, *values]):
+                    yield KEY, key
+                    if key not in values:
+                        yield from walk(existing[key])
+                    elif field == "securitySchemes":
+                        yield from walk(dict(values[key]))
+                    else:
+                        yield from walk(values[key], body=True)
+                yield END_MAP, None
+            yield END_MAP, None
+        elif name in root:
+            yield KEY, name
+            yield from walk(root[name])
+    yield END_MAP, None
+
+
+def _key(key) -> str:
+    # 与 json 模块对非字符串键的处理保持一致
+    if isinstance(key, str):
+        return key
+    if key is True:
+        return "true"
+    if key is False:
+        return "false"
+    if key is None:
+        return "null"
+    if isinstance(key, float):
+        return float.__repr__(key)
+    return str(key)
+
+
+def _iter_json(events) -> t.Iterator[str]:
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+    first = True
+    for event, value in events:
+        if event == KEY:
+            yield ("%s:" if first else ",%s:") % encode(_key(value))
+            first = True
+            continue
+        if event == END_MAP or event == END_LIST:
+            yield "}" if event == END_MAP else "]"
+            first = False
+            continue
+        if not first:
+            yield ","
+        if event == START_MAP or event == START_LIST:
+            yield "{" if event == START_MAP else "["
+            first = True
+        else:
+            yield encode(value)
+            first = False
+
+
+def _yaml_scalar(value) -> str:
+    if isinstance(value, float) and not isinstance(value, bool):
+        text = float.__repr__(value)
+        # YAML 1.1 的浮点数需要包含小数点
+        if "e" in text and "." not in text:
+            text = text.replace("e", ".0e")
+        return text
+    return json.dumps(value, ensure_ascii=False)
+
+
+_plain_key = re.compile(r"[A-Za-z_$/][A-Za-z0-9_$./{}-]*")
+# YAML 1.1 中会被解析为布尔值或 null 的单词
+_reserved_words = {"y", "n", "yes", "no", "on", "off", "true", "false", "null"}
+
+
+def _yaml_key(key) -> str:
+    key = _key(key)
+    if _plain_key.fullmatch(key) and key.lower() not in _reserved_words:
+        return key
+    return json.dumps(key, ensure_ascii=False)
+
+
+def _iter_yaml(events) -> t.Iterator[str]:
+    # 块格式的栈帧：[容器类型, 子元素缩进, 状态]
+    # 状态 inline 表示第一个子元素紧跟在 "- " 之后，newline 表示需要先换行，
+    # 二者在容器为空时分别输出 {} / []
+    stack: t.List[t.List[t.Any]] = []
+    after_key = False
+
+    def child(frame) -> str:
+        state, frame[2] = frame[2], "open"
+        if state == "inline":
+            return ""
+        if state == "newline":
+            return "\n" + " " * frame[1]
+        return " " * frame[1]
+
+    for event, value in events:
+        if event == KEY:
+            yield child(stack[-1]) + _yaml_key(value) + ":"
+            after_key = True
+            continue
+
+        if event == END_MAP or event == END_LIST:
+            kind, _, state = stack.pop()
+            if state != "open":
+                empty = "{}" if kind == START_MAP else "[]"
+                yield (" " if state == "newline" else "") + empty + "\n"
+            continue
+
+        if after_key:
+            after_key = False
+            if event == SCALAR:
+                yield " " + _yaml_scalar(value) + "\n"
+            else:
+                stack.append([event, stack[-1][1] + 2, "newline"])
+        elif stack:
+            frame = stack[-1]
+            yield child(frame) + "- "
+            if event == SCALAR:
+                yield _yaml_scalar(value) + "\n"
+            else:
+                stack.append([event, frame[1] + 2, "inline"])
+        elif event == SCALAR:
+            yield _yaml_scalar(value) + "\n"
+        else:
+            stack.append([event, 0, "inline"])
+
+
+def _chunks(parts: t.Iterable[str], chunk_size: int) -> t.Iterator[str]:
+    buffer: t.List[str] = []
+    size = 0
+    for part in parts:
+        buffer.append(part)
+        size += len(part)
+        if size >= chunk_size:
+            yield "".join(buffer)
+            buffer.clear()
+            size = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def iterbuild(
+    version,
+    openapi,
+    /,
+    *,
+    format: t.Literal["json", "yaml"] = "json",
+    encoding: t.Optional[str] = None,
+    chunk_size: int = 65536,
+):
+    """
+    逐块产生与 build() 相同的文档（紧凑 JSON 或块格式 YAML），不做校验。
+    指定 encoding 时产生 bytes。
+    """
+    assert isinstance(openapi, Root)
+    events = _events(Traversal(openapi), version)
+    if format == "json":
+        parts = _iter_json(events)
+    elif format == "yaml":
+        parts = _iter_yaml(events)
+    else:
+        raise ValueError("Invalid format: %r" % format)
+
+    for chunk in _chunks(parts, chunk_size):
+        yield chunk if encoding is None else chunk.encode(encoding)
+
+
+def build_to_stream(
+    version,
+    openapi,
+    fp,
+    /,
+    *,
+    format: t.Literal["json", "yaml"] = "json",
+    chunk_size: int = 65536,
+) -> None:
+    encoding = None if isinstance(fp, io.TextIOBase) else "utf-8"
+    for chunk in iterbuild(
+        version, openapi, format=format, encoding=encoding, chunk_size=chunk_size
+    ):
+        fp.write(chunk)
@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import collections.abc as abc
+import dataclasses
+import datetime
+import enum
+import threading
+import types
+import typing as t
+import uuid
+
+from ._base import Lazy, SchemaObject, empty
+
+_scalars: t.Dict[t.Any, t.Dict[str, t.Any]] = {
+    str: {"type": "string"},
+    int: {"type": "integer"},
+    float: {"type": "number"},
+    bool: {"type": "boolean"},
+    bytes: {"type": "string", "format": "byte"},
+    datetime.datetime: {"type": "string", "format": "date-time"},
+    datetime.date: {"type": "string", "format": "date"},
+    uuid.UUID: {"type": "string", "format": "uuid"},
+}
+_arrays = (
+    list,
+    tuple,
+    set,
+    frozenset,
+    abc.Iterable,
+    abc.Collection,
+    abc.Sequence,
+    abc.MutableSequence,
+    abc.Set,
+    abc.MutableSet,
+)
+_sets = (set, frozenset, abc.Set, abc.MutableSet)
+_objects = (dict, abc.Mapping, abc.MutableMapping)
+_union_types = tuple(
+    tp for tp in (t.Union, getattr(types, "UnionType", None)) if tp is not None
+)
+# JSON 中可以直接表示的默认值
+_json_scalars = (str, int, float, bool, type(None))
+
+
+def _is_typeddict(tp) -> bool:
+    return (
+        isinstance(tp, type)
+        and issubclass(tp, dict)
+        and hasattr(tp, "__annotations__")
+        and hasattr(tp, "__total__")
+    )
+
+
+def _literal_type(values: t.Sequence[t.Any]):
+    kinds = {type(v) for v in values}
+    for tp, schema in _scalars.items():
+        if kinds == {tp}:
+            return schema["type"]
+    return empty
+
+
+class SchemaGenerator:
+    """
+    由类型注解生成 SchemaObject：str / int / float / bool 等标量、Optional、Union、Literal、
+    List / Tuple / Set、Dict[str, X]，以及 dataclass、TypedDict 和 Enum。
+
+    每个类型只生成一次，结果缓存在生成器上。dataclass、TypedDict 和 Enum 生成有 key 的节点
+    （key 默认为类名），在文档中被引用多次时自动转为 $ref；引用自身的类型通过 Lazy 得到同一个节点。
+    不同的类型得到相同的 key 时抛出 ValueError，例如不同模块中的同名类型，可以用 key 区分。
+    """
+
+    def __init__(self, *, key: t.Callable[[type], str] = lambda tp: tp.__name__):
+        self.key = key
+        self._cache: t.Dict[t.Any, t.Any] = {}
+        self._keys: t.Dict[str, type] = {}
+        self._lock = threading.RLock()
+
+    def __call__(self, tp) -> SchemaObject:
+        try:
+            rv = self._cache[tp]
+        except (KeyError, TypeError):
+            pass
+        else:
+            # 其他线程正在生成时缓存中是 Lazy 占位
+            if not isinstance(rv, Lazy):
+                return rv
+        with self._lock:
+            return self._generate(tp)
+
+    def _generate(self, tp):
+        try:
+            cached = self._cache.get(tp)
+        except TypeError:
+            # 不可哈希的注解（例如含有 list 的 Literal）不缓存
+            return self._schema(tp)
+        if cached is None:
+            cached = self._cache[tp] = self._schema(tp)
+        return cached
+
+    def _schema(self, tp):
+        if tp in (t.Any, object):
+            return SchemaObject({})
+        if tp in _scalars:
+            return SchemaObject(_scalars[tp])
+
+        origin = t.get_origin(tp)
+        args = t.get_args(tp)
+        if origin in _union_types:
+            return self._union(args)
+        if origin is t.Literal:
+            return SchemaObject({"type": _literal_type(args), "enum": list(args)})
+        if (origin or tp) in _arrays:
+            return self._array(origin or tp, args)
+        if (origin or tp) in _objects:
+            value = args[1] if len(args) == 2 else t.Any
+            return SchemaObject(
+                {"type": "object", "additionalProperties": self._generate(value)}
+            )
+
+        if isinstance(tp, type):
+            if issubclass(tp, enum.Enum):
+                values = [member.value for member in tp]
+                return SchemaObject(
+                    {"type": _literal_type(values), "enum": values},
+                    key=self._key(tp),
+                )
+            if dataclasses.is_dataclass(tp) or _is_typeddict(tp):
+                return self._model(tp)
+        raise TypeError("Cannot generate a schema for %r" % (tp,))
+
+    def _key(self, tp: type) -> str:
+        # 同一个 key 只能对应一个类型，否则 components 中的一个会覆盖另一个
+        key = self.key(tp)
+        other = self._keys.setdefault(key, tp)
+        if other is not tp:
+            raise ValueError(
+                "%r and %r have the same key %r, pass key= to tell them apart"
+                % (other, tp, key)
+            )
+        return key
+
+    def _union(self, args: t.Tuple[t.Any, ...]):
+        nullable = type(None) in args
+        args = tuple(a for a in args if a is not type(None))
+        if len(args) == 1:
+            schema = self._generate(args[0])
+            if not nullable:
+                return schema
+            if isinstance(schema, SchemaObject) and schema.key is None:
+                return SchemaObject(dict(schema.items(), nullable=True))
+            # 有 key 的节点是共享的，不能直接修改
+            return SchemaObject({"allOf": [schema], "nullable": True})
+        return SchemaObject(
+            {"anyOf": [self._generate(a) for a in args], "nullable": nullable}
+        )
+
+    def _array(self, origin, args: t.Tuple[t.Any, ...]):
+        if origin is tuple and args and args[-1] is not Ellipsis:
+            # 定长 tuple 在 3.0 中无法表示各项的类型
+            items: t.Any = self._union(args) if len(set(args)) > 1 else args[0]
+        else:
+            items = args[0] if args else t.Any
+        if not isinstance(items, SchemaObject):
+            items = self._generate(items)
+        return SchemaObject(
+            {
+                "type": "array",
+                "items": items,
+                "uniqueItems": origin in _sets,
+            }
+        )
+
+    def _model(self, tp: type):
+        # 先放入 Lazy 占位，字段引用自身（直接或间接）时得到同一个节点
+        self._cache[tp] = Lazy(lambda: self._cache[tp])
+        try:
+            # 允许在函数中定义的类型用字符串引用自身
+            hints = t.get_type_hints(tp, localns={tp.__name__: tp})
+            properties = {}
+            required = []
+            if dataclasses.is_dataclass(tp):
+                for field in dataclasses.fields(tp):
+                    properties[field.name] = schema = self._generate(hints[field.name])
+                    if (
+                        field.default is dataclasses.MISSING
+                        and field.default_factory is dataclasses.MISSING
+                    ):
+                        required.append(field.name)
+                    else:
+                        default = field.default
+                        if isinstance(default, enum.Enum):
+                            default = default.value
+                        if isinstance(default, _json_scalars):
+                            properties[field.name] = self._default(schema, default)
+            else:
+                keys = getattr(tp, "__required_keys__", None)
+                for name, hint in hints.items():
+                    properties[name] = self._generate(hint)
+                    if (name in keys) if keys is not None else tp.__total__:
+                        required.append(name)
+            schema = SchemaObject(
+                {
+                    "type": "object",
+                    "properties": properties,
+                    "required": required or empty,
+                },
+                key=self._key(tp),
+            )
+        except BaseException:
+            del self._cache[tp]
+            raise
+        return schema
+
+    @staticmethod
+    def _default(schema, default):
+        if isinstance(schema, SchemaObject) and schema.key is None:
+            return SchemaObject(dict(schema.items(), default=default))
+        return SchemaObject({"allOf": [schema], "default": default})
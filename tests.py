@@ -391,3 +391,1673 @@ class TestValidation:
 
         with pytest.raises(OpenAPIValidationError):
             oas.build(oas.OpenAPIObject(), validate="error")
+
+
+def test_shared_schema_dumped_once(oas):
+    calls = []
+
+    class Counted(oas.SchemaObject):
+        def items(self):
+            calls.append(self)
+            return super().items()
+
+    foo = Counted({"type": "string"}, key="foo")
+    anonymous = Counted({"type": "array", "items": foo})
+    parameters = [
+        oas.ParameterObject({"name": "p%d" % i, "in": "query", "schema": anonymous})
+        for i in range(3)
+    ]
+    result = oas.build(
+        oas.OpenAPIObject(
+            {
+                "info": oas.InfoObject({"title": "title", "version": "1.0"}),
+                "paths": {
+                    "/": oas.PathItemObject(
+                        {
+                            "get": oas.OperationObject(
+                                {
+                                    "parameters": parameters,
+                                    "responses": {
+                                        "200": oas.ResponseObject({"description": "OK"})
+                                    },
+                                }
+                            )
+                        }
+                    )
+                },
+            }
+        ),
+        validate="error",
+    )
+    assert len(calls) == 2
+    schemas = [p["schema"] for p in result["paths"]["/"]["get"]["parameters"]]
+    assert schemas[0] == {"type": "array", "items": {"type": "string"}}
+    assert schemas[0] is schemas[1] is schemas[2]
+
+
+def _document(oas, schema):
+    return oas.OpenAPIObject(
+        {
+            "info": oas.InfoObject({"title": "title", "version": "1.0"}),
+            "paths": {
+                "/": oas.PathItemObject(
+                    {
+                        "get": oas.OperationObject(
+                            {
+                                "responses": {
+                                    "200": oas.ResponseObject(
+                                        {
+                                            "description": "OK",
+                                            "content": {
+                                                "application/json": oas.MediaTypeObject(
+                                                    {"schema": schema}
+                                                )
+                                            },
+                                        }
+                                    )
+                                },
+                            }
+                        )
+                    }
+                )
+            },
+        }
+    )
+
+
+def test_deeply_nested_schema(oas):
+    schema = oas.SchemaObject({"type": "string"})
+    for _ in range(5000):
+        schema = oas.SchemaObject({"type": "array", "items": schema})
+
+    result = oas.build(_document(oas, schema), validate=False)
+    schema = result["paths"]["/"]["get"]["responses"]["200"]["content"][
+        "application/json"
+    ]["schema"]
+    depth = 0
+    while schema["type"] == "array":
+        schema = schema["items"]
+        depth += 1
+    assert depth == 5000
+
+
+def test_recursive_schema(oas):
+    properties: dict = {}
+    node = oas.SchemaObject({"type": "object", "properties": properties}, key="Node")
+    # properties 是普通 dict，构造后再放入自身以形成环
+    properties["parent"] = node
+
+    result = oas.build(_document(oas, node), validate="error")
+    assert result["components"]["schemas"]["Node"] == {
+        "type": "object",
+        "properties": {"parent": {"$ref": "#/components/schemas/Node"}},
+    }
+    assert result["paths"]["/"]["get"]["responses"]["200"]["content"][
+        "application/json"
+    ]["schema"] == {"$ref": "#/components/schemas/Node"}
+
+
+def test_recursive_schema_without_key(oas):
+    properties: dict = {}
+    node = oas.SchemaObject({"type": "object", "properties": properties})
+    properties["parent"] = node
+
+    with pytest.raises(ValueError, match="Circular reference"):
+        oas.build(_document(oas, node), validate=False)
+
+
+class TestValidationCache:
+    def test_memory(self, oas):
+        cache = oas.ValidationCache()
+        schema = oas.SchemaObject({"type": "string"})
+        oas.build(_document(oas, schema), validation_cache=cache)
+        oas.build(_document(oas, schema), validation_cache=cache)
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        oas.build(
+            _document(oas, oas.SchemaObject({"type": "integer"})),
+            validation_cache=cache,
+        )
+        assert (cache.hits, cache.misses) == (1, 2)
+
+    def test_invalid_spec_not_cached(self, oas):
+        cache = oas.ValidationCache()
+        for _ in range(2):
+            with pytest.warns(UserWarning):
+                oas.build(oas.OpenAPIObject(), validation_cache=cache)
+        assert (cache.hits, cache.misses) == (0, 2)
+
+    def test_directory(self, oas, tmp_path):
+        # 目录中的其他文件和子目录不会被淘汰
+        (tmp_path / "important.txt").write_text("keep")
+        (tmp_path / "sub").mkdir()
+        for i in range(3):
+            oas.build(
+                _document(oas, oas.SchemaObject({"type": "string", "maxLength": i})),
+                validation_cache=oas.ValidationCache(str(tmp_path), maxsize=2),
+            )
+        assert len(list(tmp_path.iterdir())) == 4
+        assert (tmp_path / "important.txt").read_text() == "keep"
+
+        cache = oas.ValidationCache(str(tmp_path))
+        oas.build(
+            _document(oas, oas.SchemaObject({"type": "string", "maxLength": 2})),
+            validation_cache=cache,
+        )
+        assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_mutually_recursive_schemas(oas):
+    a_properties: dict = {}
+    b_properties: dict = {}
+    a = oas.SchemaObject({"type": "object", "properties": a_properties}, key="A")
+    b = oas.SchemaObject({"type": "object", "properties": b_properties}, key="B")
+    a_properties["b"] = b
+    b_properties["a"] = a
+
+    # 无论从环上的哪个节点进入，环上带 key 的 SchemaObject 都会被转为 $ref
+    for schema in (a, b):
+        result = oas.build(_document(oas, schema), validate="error")
+        assert result["components"]["schemas"] == {
+            "A": {
+                "type": "object",
+                "properties": {"b": {"$ref": "#/components/schemas/B"}},
+            },
+            "B": {
+                "type": "object",
+                "properties": {"a": {"$ref": "#/components/schemas/A"}},
+            },
+        }
+
+
+class TestBuildSession:
+    def _operation(self, oas, schema):
+        return oas.OperationObject(
+            {
+                "responses": {
+                    "200": oas.ResponseObject(
+                        {
+                            "description": "OK",
+                            "content": {
+                                "application/json": oas.MediaTypeObject(
+                                    {"schema": schema}
+                                )
+                            },
+                        }
+                    )
+                }
+            }
+        )
+
+    def test_incremental(self, oas):
+        foo = oas.SchemaObject({"type": "string"}, key="foo")
+        bar = oas.SchemaObject({"type": "array", "items": foo}, key="bar")
+        paths = {"/a": oas.PathItemObject({"get": self._operation(oas, bar)})}
+        info = oas.InfoObject({"title": "title", "version": "1.0"})
+        session = oas.session(oas.OpenAPIObject({"info": info, "paths": paths}))
+
+        def expected():
+            return oas.build(oas.OpenAPIObject({"info": info, "paths": dict(paths)}))
+
+        assert session.build() == expected()
+
+        # bar 被引用两次，转为 $ref
+        paths["/b"] = oas.PathItemObject({"get": self._operation(oas, bar)})
+        session.set_path("/b", paths["/b"])
+        result = session.build()
+        assert result == expected()
+        assert "bar" in result["components"]["schemas"]
+
+        # foo 被引用两次，/a 中内联的 bar 也需要更新
+        operation = self._operation(oas, foo)
+        paths["/a"] = oas.PathItemObject({**paths["/a"], "post": operation})
+        session.set_operation("/a", "post", operation)
+        assert session.build() == expected()
+
+        # 恢复为只引用一次，重新内联
+        del paths["/b"]
+        session.remove_path("/b")
+        del paths["/a"]
+        session.remove_path("/a")
+        paths["/c"] = oas.PathItemObject({"get": self._operation(oas, bar)})
+        session.set_path("/c", paths["/c"])
+        result = session.build()
+        assert result == expected()
+        assert "components" not in result
+
+    def test_unchanged_paths_reused(self, oas):
+        paths = {
+            "/a": oas.PathItemObject(
+                {"get": self._operation(oas, oas.SchemaObject({"type": "string"}))}
+            )
+        }
+        info = oas.InfoObject({"title": "title", "version": "1.0"})
+        session = oas.session(oas.OpenAPIObject({"info": info, "paths": paths}))
+        first = session.build()
+        session.set_path(
+            "/b",
+            oas.PathItemObject(
+                {"get": self._operation(oas, oas.SchemaObject({"type": "integer"}))}
+            ),
+        )
+        second = session.build()
+        assert second["paths"]["/a"] is first["paths"]["/a"]
+
+    def test_set_paths(self, oas):
+        def item(tp):
+            return oas.PathItemObject(
+                {"get": self._operation(oas, oas.SchemaObject({"type": tp}))}
+            )
+
+        paths = {"/a": item("string"), "/b": item("integer")}
+        info = oas.InfoObject({"title": "title", "version": "1.0"})
+        session = oas.session(oas.OpenAPIObject({"info": info, "paths": paths}))
+        first = session.build()
+
+        paths = {"/c": item("boolean"), "/a": paths["/a"]}
+        session.set_paths(paths)
+        second = session.build()
+        assert list(second["paths"]) == ["/c", "/a"]
+        assert second == oas.build(oas.OpenAPIObject({"info": info, "paths": paths}))
+        assert second["paths"]["/a"] is first["paths"]["/a"]
+
+
+class TestStream:
+    def _document(self, oas):
+        foo = oas.SchemaObject({"type": "string", "description": "名称"}, key="foo")
+        return oas.OpenAPIObject(
+            {
+                "info": oas.InfoObject({"title": "title", "version": "1.0"}),
+                "paths": {
+                    "/": oas.PathItemObject(
+                        {
+                            "get": oas.OperationObject(
+                                {
+                                    "parameters": [
+                                        oas.ParameterObject(
+                                            {"name": "a", "in": "query", "schema": foo}
+                                        ),
+                                        oas.ParameterObject(
+                                            {"name": "b", "in": "query", "schema": foo}
+                                        ),
+                                    ],
+                                    "security": [
+                                        oas.SecurityRequirementObject(
+                                            scheme=oas.SecuritySchemeObject(
+                                                {"type": "http", "scheme": "basic"},
+                                                key="HTTPBasic",
+                                            )
+                                        )
+                                    ],
+                                    "responses": {
+                                        "200": oas.ResponseObject(
+                                            {"description": "OK", "content": {}}
+                                        )
+                                    },
+                                }
+                            )
+                        }
+                    )
+                },
+            }
+        )
+
+    def test_json(self, oas):
+        import io
+        import json
+
+        document = self._document(oas)
+        expected = json.dumps(
+            oas.build(document), ensure_ascii=False, separators=(",", ":")
+        )
+        assert "".join(oas.iterbuild(document, chunk_size=16)) == expected
+
+        fp = io.BytesIO()
+        oas.build_to_stream(document, fp)
+        assert fp.getvalue() == expected.encode()
+
+    def test_yaml(self, oas):
+        import json
+
+        yaml = pytest.importorskip("yaml")
+        document = self._document(oas)
+        assert yaml.safe_load("".join(oas.iterbuild(document, format="yaml"))) == (
+            json.loads(json.dumps(oas.build(document)))
+        )
+
+
+def test_build_artifact(oas):
+    import gzip
+    import json
+
+    document = _document(oas, oas.SchemaObject({"type": "string"}))
+    artifact = oas.build_artifact(document)
+    assert oas.build_artifact(document) is artifact
+    assert json.loads(artifact.body) == oas.build(document)
+    assert artifact.length == len(artifact.body)
+    assert gzip.decompress(artifact.gzip) == artifact.body
+
+    assert artifact.not_modified('W/"x", %s' % artifact.etag)
+    assert not artifact.not_modified('"x"')
+    assert not artifact.not_modified(None)
+    assert artifact.encode("br, gzip;q=0.5") == (artifact.gzip, "gzip")
+    assert artifact.encode("gzip;q=0") == (artifact.body, None)
+
+    oas.build_artifact.cache_clear()
+    rebuilt = oas.build_artifact(document)
+    assert rebuilt is not artifact
+    assert rebuilt.etag == artifact.etag
+
+
+def test_build_artifact_concurrent(oas):
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from functools import partial
+
+    calls = []
+    release = threading.Event()
+
+    def validator(spec):
+        calls.append(spec)
+        release.wait(5)
+        return []
+
+    # 并发的相同请求只构建一次，淘汰与命中同时发生时不会出错
+    builder = type(oas.build_artifact)(oas.version, maxsize=1)
+    document = _document(oas, oas.SchemaObject({"type": "string"}))
+    with ThreadPoolExecutor(8) as executor:
+        futures = [
+            executor.submit(builder, document, validator=validator) for _ in range(8)
+        ]
+        release.set()
+        artifacts = {id(f.result()) for f in futures}
+    assert len(artifacts) == 1 and len(calls) == 1
+
+    documents = [_document(oas, oas.SchemaObject({"maxLength": i})) for i in range(4)]
+    with ThreadPoolExecutor(8) as executor:
+        list(executor.map(partial(builder, validate=False), documents * 50))
+
+
+def test_deduplicate(oas):
+    def uuid():
+        return oas.SchemaObject({"type": "string", "format": "uuid"})
+
+    schema = oas.SchemaObject(
+        {
+            "type": "object",
+            "properties": {
+                "id": uuid(),
+                "parent": uuid(),
+                "children": oas.SchemaObject({"type": "array", "items": uuid()}),
+                "name": oas.SchemaObject({"type": "string"}),
+            },
+        }
+    )
+    document = _document(oas, schema)
+    assert "components" not in oas.build(document)
+
+    rv = oas.build(document, validate="error", deduplicate=oas.Deduplicate())
+    (key,) = rv["components"]["schemas"]
+    assert key.startswith("Schema")
+    assert rv["components"]["schemas"][key] == {"type": "string", "format": "uuid"}
+    properties = rv["paths"]["/"]["get"]["responses"]["200"]["content"][
+        "application/json"
+    ]["schema"]["properties"]
+    assert properties["id"] == {"$ref": "#/components/schemas/%s" % key}
+    assert properties["children"]["items"] == properties["id"]
+
+    # key 只由内容决定
+    other = oas.SchemaObject({"type": "array", "items": uuid(), "example": uuid()})
+    rv = oas.build(_document(oas, other), deduplicate=oas.Deduplicate())
+    assert list(rv["components"]["schemas"]) == [key]
+    assert "components" not in oas.build(
+        _document(oas, uuid()), deduplicate=oas.Deduplicate()
+    )
+    assert oas.build(
+        document, deduplicate=oas.Deduplicate(min_references=3)
+    ) == oas.build(document, deduplicate=oas.Deduplicate(min_references=2))
+    assert "components" not in oas.build(
+        document, deduplicate=oas.Deduplicate(min_references=4)
+    )
+    assert "components" not in oas.build(
+        document, deduplicate=oas.Deduplicate(min_size=10)
+    )
+
+
+def test_lazy_transform(oas):
+    import weakref
+
+    from build_openapispec._base import Field
+
+    calls = []
+
+    class Object(oas.SchemaObject):
+        __slots__ = ()
+        __declare_fields__ = {
+            "description": Field(transform=lambda v: calls.append(v) or v.strip()),
+            "nullable": Field(default=False),
+        }
+
+    schema = Object([("description", " text "), ("nullable", False)])
+    assert not hasattr(schema, "__dict__")
+    assert weakref.ref(schema)() is schema
+    assert "description" in schema and "nullable" not in schema
+    assert calls == []
+    assert schema["description"] == "text"
+    assert dict(schema) == {"description": "text"}
+    assert calls == [" text "]
+
+    other = Object({"description": " text "})
+    assert schema == other and hash(schema) != hash(other)
+
+
+def test_build_stats(oas):
+    from contextlib import contextmanager
+
+    events = []
+
+    @contextmanager
+    def hook(phase):
+        events.append(phase)
+        yield
+
+    item = oas.SchemaObject({"type": "string"}, key="item")
+    schema = oas.SchemaObject({"type": "array", "items": [item, item]})
+    stats = oas.BuildStats(largest=1)
+    oas.build(_document(oas, schema), validate=False, hook=hook, stats=stats)
+
+    assert events == ["traverse", "dumps"]
+    assert set(stats.phases) == {"traverse", "dumps"}
+    assert stats.nodes["SchemaObject"] == 2
+    assert stats.nodes["OperationObject"] == 1
+    assert stats.components == 1
+    assert stats.largest == [(schema, 4)]
+
+    with pytest.warns(UserWarning) as record:
+        oas.build(oas.OpenAPIObject({}), hook=hook, stats=stats)
+    assert record[0].filename == __file__
+    assert events[-1] == "validate" and "validate" in stats.phases
+
+
+def test_lazy(oas):
+    calls = []
+
+    def factory(schema):
+        def f():
+            calls.append(schema)
+            return schema()
+
+        return f
+
+    # 相互引用，pet 定义时 owner 还不存在
+    pet = oas.SchemaObject(
+        {
+            "type": "object",
+            "properties": {"owner": oas.Lazy(factory(lambda: owner))},
+            "description": oas.Lazy(lambda: "\n    A pet.\n    "),
+        },
+        key="Pet",
+    )
+    owner = oas.SchemaObject(
+        {"type": "object", "properties": {"pets": {"type": "array", "items": pet}}},
+        key="Owner",
+    )
+    document = _document(oas, oas.Lazy(lambda: pet))
+
+    rv = oas.build(document, validate="error")
+    assert rv["components"]["schemas"]["Pet"]["properties"]["owner"] == {
+        "$ref": "#/components/schemas/Owner"
+    }
+    assert rv["components"]["schemas"]["Pet"]["description"] == "A pet."
+    assert pet["properties"]["owner"] is owner
+    assert len(calls) == 1
+
+    assert oas.build(document, validate="error") == rv
+    assert len(calls) == 1
+
+
+def test_subset(oas):
+    shared = oas.SchemaObject({"type": "string"}, key="shared")
+
+    def operation(tag):
+        return oas.OperationObject(
+            {
+                "tags": [tag],
+                "responses": {
+                    "200": oas.ResponseObject(
+                        {
+                            "description": "OK",
+                            "content": {
+                                "application/json": oas.MediaTypeObject(
+                                    {"schema": shared}
+                                )
+                            },
+                        }
+                    )
+                },
+            }
+        )
+
+    document = oas.OpenAPIObject(
+        {
+            "info": oas.InfoObject({"title": "title", "version": "1.0"}),
+            "paths": {
+                "/a": oas.PathItemObject(
+                    {"get": operation("public"), "post": operation("internal")}
+                ),
+                "/b": oas.PathItemObject({"get": operation("internal")}),
+            },
+        }
+    )
+    public = lambda path, method, operation: "public" in operation["tags"]  # noqa
+
+    rv = oas.build(document, include=public)
+    assert list(rv["paths"]) == ["/a"] and list(rv["paths"]["/a"]) == ["get"]
+    # 子集中只被引用一次，内联
+    assert "components" not in rv
+    assert rv["paths"]["/a"]["get"]["responses"]["200"]["content"]["application/json"][
+        "schema"
+    ] == {"type": "string"}
+
+    variants = oas.build_variants(
+        document, {"public": public, "all": lambda *args: True, "again": public}
+    )
+    assert variants["public"] == variants["again"] == rv
+    assert variants["all"] == oas.build(document)
+
+    # 普通 dict 形式的 path item
+    plain = oas.OpenAPIObject(
+        {
+            "info": document["info"],
+            "paths": {k: dict(v) for k, v in document["paths"].items()},
+        }
+    )
+    assert oas.build(plain, include=public) == rv
+    assert oas.build_variants(plain, {"public": public})["public"] == rv
+
+
+def test_diff(oas):
+    def document(description, extra=None):
+        pet = oas.SchemaObject(
+            {"type": "object", "description": description}, key="Pet"
+        )
+        paths = {
+            "/pets": oas.PathItemObject(
+                {
+                    "get": _document(oas, pet)["paths"]["/"]["get"],
+                    "post": _document(oas, pet)["paths"]["/"]["get"],
+                }
+            ),
+            "/users": _document(oas, oas.SchemaObject({"type": "string"}))["paths"][
+                "/"
+            ],
+        }
+        if extra:
+            paths["/extra"] = _document(oas, extra)["paths"]["/"]
+        return oas.OpenAPIObject(
+            {"info": oas.InfoObject({"title": "t", "version": "1"}), "paths": paths}
+        )
+
+    a = document("pet")
+    assert oas.fingerprint(a) == oas.fingerprint(document("pet"))
+    assert oas.fingerprint(a) != oas.fingerprint(document("cat"))
+    assert not oas.diff(a, document("pet"))
+
+    rv = oas.diff(a, document("cat", oas.SchemaObject({"type": "integer"}, key="Id")))
+    assert rv.paths == (["/extra"], [], ["/pets"])
+    assert rv.operations == (
+        [("/extra", "get")],
+        [],
+        [("/pets", "get"), ("/pets", "post")],
+    )
+    assert rv.components == ([("schemas", "Id")], [], [("schemas", "Pet")])
+
+    # 加载的文档中 path 和 $ref 都是 Lazy
+    old = oas.load(oas.build(document("pet")))
+    new = oas.load(oas.build(document("cat", oas.SchemaObject({"type": "integer"}))))
+    rv = oas.diff(old, new)
+    assert rv.paths == (["/extra"], [], ["/pets"])
+    assert rv.components == ([], [], [("schemas", "Pet")])
+    assert not oas.diff(old, oas.load(oas.build(document("pet"))))
+
+
+class TestFastValidation:
+    def test_errors(self, oas):
+        from openapi_spec_validator.validation.exceptions import OpenAPIValidationError
+
+        scheme = oas.SecuritySchemeObject({"type": "basic"}, key="basic")
+        document = oas.OpenAPIObject(
+            {
+                "info": oas.InfoObject({"title": "title", "version": "1.0"}),
+                "paths": {
+                    "/{id}": oas.PathItemObject(
+                        {
+                            "get": oas.OperationObject(
+                                {
+                                    "parameters": [
+                                        oas.ParameterObject(
+                                            {"name": "id", "in": "path"}
+                                        ),
+                                        oas.ParameterObject(
+                                            {"name": "q", "in": "body"}
+                                        ),
+                                    ],
+                                    "responses": {"200": oas.ResponseObject({})},
+                                    "security": [
+                                        oas.SecurityRequirementObject(scheme=scheme)
+                                    ],
+                                }
+                            )
+                        }
+                    )
+                },
+            }
+        )
+        assert oas.check(document) == [
+            "ParameterObject: path parameter 'id' must be required",
+            "ParameterObject: 'in' must be one of 'query', 'header', 'path', "
+            "'cookie', got 'body'",
+            "ResponseObject: 'description' is required",
+            "SecuritySchemeObject: 'type' must be one of 'apiKey', 'http', "
+            "'oauth2', 'openIdConnect', got 'basic'",
+        ]
+        with pytest.raises(OpenAPIValidationError):
+            oas.build(document, validate="error", validator="fast")
+
+    def test_cached(self, oas):
+        response = oas.ResponseObject({"description": "OK"})
+        document = _document(oas, oas.SchemaObject({"type": "string"}))
+        assert oas.check(document) == []
+        assert response.errors() == () and response.errors() is response.errors()
+        assert oas.build(document, validate="error", validator="fast") == oas.build(
+            document, validate="error"
+        )
+
+    def test_versions(self, oas):
+        import json
+
+        from build_openapispec import openapispec
+
+        oas31 = openapispec("3.1.0")
+        scheme = oas.SecuritySchemeObject({"type": "mutualTLS"}, key="mtls")
+        null = oas.SchemaObject({"type": "null"})
+        union = oas.SchemaObject({"type": ["string", "integer"]})
+        assert scheme.errors("3.1.0") == null.errors("3.1.0") == ()
+        assert union.errors("3.1.0") == ()
+        assert oas.SchemaObject({"type": ["string", "file"]}).errors("3.1.0") == (
+            "SchemaObject: 'type' must be one of 'array', 'boolean', 'integer', "
+            "'number', 'object', 'string', 'null', got ['string', 'file']",
+        )
+        # 各版本的结果分别缓存
+        assert null.errors() == (
+            "SchemaObject: 'type' must be one of 'array', 'boolean', 'integer', "
+            "'number', 'object', 'string', got 'null'",
+        )
+        assert null.errors("3.1.0") == ()
+
+        # 3.1 中 paths 不是必须的
+        document = oas.OpenAPIObject(
+            {
+                "info": oas.InfoObject({"title": "title", "version": "1.0"}),
+                "webhooks": {
+                    "ping": oas.PathItemObject(
+                        {
+                            "post": oas.OperationObject(
+                                {
+                                    "security": [
+                                        oas.SecurityRequirementObject(scheme=scheme)
+                                    ],
+                                    "responses": {
+                                        "200": oas.ResponseObject(
+                                            {
+                                                "description": "OK",
+                                                "content": {
+                                                    "application/json": {
+                                                        "schema": union
+                                                    }
+                                                },
+                                            }
+                                        )
+                                    },
+                                }
+                            )
+                        }
+                    )
+                },
+            }
+        )
+        assert oas.check(document) == [
+            "SecuritySchemeObject: 'type' must be one of 'apiKey', 'http', "
+            "'oauth2', 'openIdConnect', got 'mutualTLS'",
+            "SchemaObject: 'type' must be one of 'array', 'boolean', 'integer', "
+            "'number', 'object', 'string', got ['string', 'integer']",
+            "OpenAPIObject: 'paths' is required",
+        ]
+        assert oas31.check(document) == []
+        rv = oas31.build(document, validate="error", validator="fast")
+        assert rv == oas31.build(document, validate="error")
+        assert oas31.session(document).build() == rv
+        assert oas.build_versions(document, ["3.1.0"], validator="fast") == {
+            "3.1.0": rv
+        }
+        assert json.loads(
+            oas31.build_artifact(document, validate="error", validator="fast").body
+        ) == json.loads(json.dumps(rv))
+        # 加载的 3.1 文档同样按 3.1 的规则检查
+        loaded = oas31.load(rv)
+        assert oas31.check(loaded) == []
+        assert oas31.build(loaded, validate="error", validator="fast") == rv
+
+
+def _no_errors(spec):
+    return []
+
+
+def test_snapshot(oas, tmp_path):
+    import json
+    import os
+    import subprocess
+    import sys
+
+    snapshot = oas.Snapshot(str(tmp_path))
+    document = _document(oas, oas.SchemaObject({"type": "string"}))
+    rv = oas.build(document, snapshot=snapshot)
+    assert len(list(tmp_path.iterdir())) == 1
+
+    # 相同内容的新树直接读取快照
+    stats = oas.BuildStats()
+    again = _document(oas, oas.SchemaObject({"type": "string"}))
+    assert oas.build(again, snapshot=snapshot, stats=stats) == rv
+    assert list(stats.phases) == ["snapshot"]
+
+    options = dict(validate="warning", validator="full", deduplicate=None)
+    body = snapshot.read(snapshot.key(oas.version, again, **options))
+    assert body is not None and json.loads(bytes(body)) == rv
+    assert snapshot.read(snapshot.key("3.1.0", again, **options)) is None
+
+    changed = _document(oas, oas.SchemaObject({"type": "integer"}))
+    assert oas.build(changed, snapshot=snapshot) != rv
+    assert len(list(tmp_path.iterdir())) == 2
+
+    # 自定义的校验函数按模块名和限定名计入 key，与内存地址无关
+    code = (
+        "import tests; from build_openapispec import openapispec; "
+        "oas = openapispec('3.0.3'); "
+        "document = tests._document(oas, oas.SchemaObject({'type': 'string'})); "
+        "print(oas.Snapshot(%r).key(oas.version, document, validator=tests._no_errors))"
+        % str(tmp_path)
+    )
+    other = subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=os.path.dirname(__file__),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert other.stdout.strip() == snapshot.key(
+        oas.version, again, validator=_no_errors
+    )
+    with pytest.raises(ValueError):
+        oas.build(again, snapshot=snapshot, validator=lambda spec: [])
+
+
+def test_cached_builder(oas):
+    import json
+    import threading
+    import time
+    from contextlib import contextmanager
+
+    builds = []
+    document = _document(oas, oas.SchemaObject({"type": "string"}))
+    barrier = threading.Barrier(20)
+
+    @contextmanager
+    def hook(phase):
+        if phase == "traverse":
+            builds.append(phase)
+            # 让其他线程在构建完成前到达
+            time.sleep(0.2)
+        yield
+
+    builder = oas.builder(document, hook=hook)
+    results = []
+
+    def run():
+        barrier.wait()
+        results.append(builder.get())
+
+    threads = [threading.Thread(target=run) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # 并发的请求只构建一次，所有线程得到同一个对象
+    assert len(builds) == 1
+    assert all(rv is results[0] for rv in results)
+    rv = results[0]
+    assert rv == oas.build(document)
+    assert json.loads(json.dumps(rv)) == rv
+    with pytest.raises(TypeError):
+        rv["openapi"] = "3.1.0"
+    with pytest.raises(TypeError):
+        rv["paths"].clear()
+
+    assert builder.get() is rv
+    builder.invalidate(_document(oas, oas.SchemaObject({"type": "integer"})))
+    assert builder.get() != rv
+    assert len(builds) == 2
+
+
+def test_abuild(oas):
+    import asyncio
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from contextlib import contextmanager
+
+    phases = []
+    started = threading.Event()
+    release = threading.Event()
+
+    @contextmanager
+    def hook(phase):
+        phases.append(phase)
+        yield
+
+    @contextmanager
+    def blocking(phase):
+        phases.append(phase)
+        started.set()
+        release.wait(5)
+        yield
+
+    document = _document(oas, oas.SchemaObject({"type": "string"}))
+    cache = oas.BuildCache()
+
+    async def main(executor):
+        rv = await oas.abuild(document, executor=executor)
+        assert rv == oas.build(document)
+
+        cached = await oas.abuild(document, cache=cache, hook=hook)
+        assert cached == rv
+        with pytest.raises(TypeError):
+            cached["openapi"] = "3.1.0"
+        # 内容相同的新树直接使用缓存
+        again = _document(oas, oas.SchemaObject({"type": "string"}))
+        assert await oas.abuild(again, cache=cache, hook=hook) is cached
+        assert phases == ["traverse", "dumps", "validate"]
+
+        # 闭包没有稳定的 key，不使用缓存；模块级的函数按名字计入 key
+        def keep(value):
+            return lambda path, method, operation: value
+
+        for value in (True, False):
+            rv = await oas.abuild(document, include=keep(value), cache=cache)
+            assert bool(rv["paths"]) is value
+        with pytest.raises(ValueError):
+            cache.key(oas.version, document, include=keep(True))
+        custom = await oas.abuild(document, validator=_no_errors, cache=cache)
+        assert await oas.abuild(again, validator=_no_errors, cache=cache) is custom
+
+        # 取消后构建在下一个阶段开始前停止
+        phases.clear()
+        task = asyncio.ensure_future(
+            oas.abuild(document, executor=executor, hook=blocking)
+        )
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        release.set()
+
+    with ThreadPoolExecutor(1) as executor:
+        asyncio.run(main(executor))
+    assert phases == ["traverse"]
+
+
+def test_reusable_components(oas):
+    import json
+
+    error = oas.SchemaObject({"type": "object"}, key="Error")
+    page = oas.ParameterObject(
+        {"name": "page", "in": "query", "schema": {"type": "integer"}}, key="page"
+    )
+    once = oas.ParameterObject(
+        {"name": "q", "in": "query", "schema": {"type": "string"}}, key="q"
+    )
+    response = oas.ResponseObject(
+        {
+            "description": "Error",
+            "content": {"application/json": oas.MediaTypeObject({"schema": error})},
+        },
+        key="Error",
+    )
+    inline = oas.ResponseObject({"description": "OK"})
+    scheme = oas.SecuritySchemeObject({"type": "http", "scheme": "bearer"}, key="auth")
+
+    def operation(parameters):
+        return oas.OperationObject(
+            {
+                "parameters": parameters,
+                "security": [oas.SecurityRequirementObject(scheme=scheme)],
+                "responses": {"200": inline, "400": response},
+            }
+        )
+
+    document = oas.OpenAPIObject(
+        {
+            "info": oas.InfoObject({"title": "title", "version": "1.0"}),
+            "paths": {
+                "/a": oas.PathItemObject({"get": operation([page, once])}),
+                "/b": oas.PathItemObject({"get": operation([page])}),
+            },
+        }
+    )
+    rv = oas.build(document, validate="error")
+
+    # 出现多次的有 key 的对象转为 $ref，只出现一次的和没有 key 的对象内联
+    assert rv["paths"]["/a"]["get"]["parameters"] == [
+        {"$ref": "#/components/parameters/page"},
+        {"name": "q", "in": "query", "schema": {"type": "string"}},
+    ]
+    assert rv["paths"]["/b"]["get"]["responses"] == {
+        "200": {"description": "OK"},
+        "400": {"$ref": "#/components/responses/Error"},
+    }
+    # Error schema 只在 response 组件中出现一次
+    assert rv["components"] == {
+        "parameters": {
+            "page": {"name": "page", "in": "query", "schema": {"type": "integer"}}
+        },
+        "securitySchemes": {"auth": {"type": "http", "scheme": "bearer"}},
+        "responses": {
+            "Error": {
+                "description": "Error",
+                "content": {"application/json": {"schema": {"type": "object"}}},
+            }
+        },
+    }
+    assert json.loads("".join(oas.iterbuild(document))) == rv
+    assert oas.session(document).build() == rv
+
+    assert type(page) is oas.ParameterObject and type(inline) is oas.ResponseObject
+    assert oas.check(oas.ParameterObject({"name": "a", "in": "query"}, key="a b")) == [
+        "ParameterObject: invalid key 'a b'"
+    ]
+
+
+def test_reusable_components_in_process_pool(oas):
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    from build_openapispec._base import build
+
+    page = oas.ParameterObject(
+        {"name": "page", "in": "query", "schema": {"type": "integer"}}, key="page"
+    )
+    document = oas.OpenAPIObject(
+        {
+            "info": oas.InfoObject({"title": "title", "version": "1.0"}),
+            "paths": {
+                path: oas.PathItemObject(
+                    {
+                        "get": oas.OperationObject(
+                            {
+                                "parameters": [page],
+                                "responses": {
+                                    "200": oas.ResponseObject({"description": "OK"})
+                                },
+                            }
+                        )
+                    }
+                )
+                for path in ("/a", "/b")
+            },
+        }
+    )
+    # 新进程中没有构造过任何有 key 的节点，也能还原
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(1, mp_context=context) as executor:
+        rv = executor.submit(build, oas.version, document, validate="error").result()
+    assert rv == oas.build(document)
+    assert "parameters" in rv["components"]
+
+
+def test_load(oas, tmp_path):
+    import io
+    import json
+
+    from build_openapispec._base import count_references
+
+    spec = {
+        "openapi": "3.0.3",
+        "info": {"title": "title", "version": "1.0"},
+        "paths": {
+            "/a": {
+                "get": {
+                    "responses": {
+                        "200": {
+                            "description": "OK",
+                            "content": {
+                                "application/json": {
+                                    "schema": {"$ref": "#/components/schemas/Node"}
+                                }
+                            },
+                        }
+                    }
+                }
+            },
+            "/b": {
+                "get": {
+                    "parameters": [{"$ref": "#/components/parameters/page"}],
+                    "responses": {"200": {"$ref": "#/components/responses/Node"}},
+                }
+            },
+        },
+        "components": {
+            "schemas": {
+                "Node": {
+                    "type": "object",
+                    "properties": {
+                        "children": {
+                            "type": "array",
+                            "items": {"$ref": "#/components/schemas/Node"},
+                        }
+                    },
+                }
+            },
+            "parameters": {
+                "page": {"name": "page", "in": "query", "schema": {"type": "integer"}}
+            },
+            "responses": {
+                "Node": {
+                    "description": "OK",
+                    "content": {
+                        "application/json": {
+                            "schema": {"$ref": "#/components/schemas/Node"}
+                        }
+                    },
+                }
+            },
+        },
+    }
+
+    document = oas.load(spec)
+    # path 在第一次被遍历时才转换
+    assert isinstance(document["paths"]["/a"], oas.Lazy)
+    rv = oas.build(document, validate="error")
+    assert isinstance(document["paths"]["/a"], oas.PathItemObject)
+
+    # 只被引用一次的 parameter 和 response 被内联，schema 仍然是 $ref
+    assert rv["components"] == {"schemas": spec["components"]["schemas"]}
+    assert rv["paths"]["/b"]["get"]["parameters"] == [
+        spec["components"]["parameters"]["page"]
+    ]
+    assert rv["paths"]["/b"]["get"]["responses"]["200"] == (
+        spec["components"]["responses"]["Node"]
+    )
+
+    # 所有 $ref 共享同一个节点
+    references = count_references(oas.load(spec))
+    assert {
+        (type(n).__name__, n.key): count for n, count in references.items() if n.key
+    } == {
+        ("SchemaObject", "Node"): 3,
+        ("ResponseObject", "Node"): 1,
+        ("ParameterObject", "page"): 1,
+    }
+
+    path = tmp_path / "spec.json"
+    path.write_text(json.dumps(spec))
+    assert oas.build(oas.load(str(path))) == rv
+    yaml = "openapi: 3.0.3\ninfo: {title: title, version: '1.0'}\npaths: {}\n"
+    assert oas.build(oas.load(io.StringIO(yaml))) == {
+        "openapi": "3.0.3",
+        "info": {"title": "title", "version": "1.0"},
+        "paths": {},
+    }
+
+    with pytest.raises(ValueError):
+        oas.load(dict(spec, openapi="2.0"))
+
+
+def _dangling(rv):
+    # 指向 components 但找不到目标的 $ref
+    components = rv.get("components", {})
+    dangling, stack = [], [rv]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            ref = value.get("$ref")
+            if isinstance(ref, str) and ref.startswith("#/components/"):
+                field, name = ref[len("#/components/") :].split("/")
+                if name not in components.get(field, {}):
+                    dangling.append(ref)
+            stack.extend(value.values())
+        elif isinstance(value, (list, tuple)):
+            stack.extend(value)
+    return dangling
+
+
+def test_load_round_trip(oas):
+    import json
+
+    spec = {
+        "openapi": "3.0.3",
+        "info": {"title": "title", "version": "1.0"},
+        "security": [{"oauth": ["read"]}, {"key": [], "oauth": []}],
+        "paths": {
+            "/pets": {
+                "get": {
+                    "responses": {
+                        "200": {
+                            "description": "OK",
+                            "headers": {
+                                "X-Rate": {
+                                    "schema": {"$ref": "#/components/schemas/Rate"}
+                                },
+                                "X-Trace": {"$ref": "#/components/headers/Trace"},
+                            },
+                            "content": {
+                                "application/json": {
+                                    "schema": {"$ref": "#/components/schemas/Pet"}
+                                }
+                            },
+                        }
+                    },
+                    "callbacks": {
+                        "event": {
+                            "{$request.body#/url}": {
+                                "post": {
+                                    "requestBody": {
+                                        "content": {
+                                            "application/json": {
+                                                "schema": {
+                                                    "$ref": "#/components/schemas/Rate"
+                                                }
+                                            }
+                                        }
+                                    },
+                                    "responses": {"200": {"description": "OK"}},
+                                }
+                            }
+                        }
+                    },
+                }
+            }
+        },
+        "components": {
+            "schemas": {
+                "Rate": {"type": "integer"},
+                "Pet": {
+                    "oneOf": [{"$ref": "#/components/schemas/Cat"}],
+                    "discriminator": {
+                        "propertyName": "kind",
+                        "mapping": {"cat": "#/components/schemas/Cat", "dog": "Dog"},
+                    },
+                },
+                "Cat": {"type": "object"},
+                "Dog": {"type": "object"},
+            },
+            "headers": {"Trace": {"schema": {"$ref": "#/components/schemas/Rate"}}},
+            "securitySchemes": {
+                "oauth": {
+                    "type": "oauth2",
+                    "flows": {
+                        "implicit": {
+                            "authorizationUrl": "https://example.com",
+                            "scopes": {"read": "read"},
+                        }
+                    },
+                },
+                "key": {"type": "apiKey", "in": "header", "name": "key"},
+            },
+        },
+    }
+
+    rv = oas.build(oas.load(spec), validate="error")
+    assert _dangling(rv) == []
+    assert rv["security"] == spec["security"]
+    assert rv["components"]["securitySchemes"] == spec["components"]["securitySchemes"]
+    assert rv["components"]["headers"] == spec["components"]["headers"]
+    # Rate 被 header、response header 和 callback 引用
+    assert list(rv["components"]["schemas"]) == ["Cat", "Dog", "Rate"]
+
+    assert json.loads("".join(oas.iterbuild(oas.load(spec)))) == rv
+    assert oas.session(oas.load(spec)).build() == rv
+
+
+def test_load_alias(oas):
+    import threading
+
+    # 别名 component 在 Lazy 的 factory 中解析另一个 Lazy，解析可以重入
+    spec = {
+        "openapi": "3.0.3",
+        "info": {"title": "title", "version": "1.0"},
+        "paths": {
+            "/": {
+                "get": {
+                    "responses": {
+                        "200": {
+                            "description": "OK",
+                            "content": {
+                                "application/json": {
+                                    "schema": {"$ref": "#/components/schemas/A"}
+                                }
+                            },
+                        }
+                    }
+                }
+            }
+        },
+        "components": {
+            "schemas": {
+                "A": {"$ref": "#/components/schemas/B"},
+                "B": {"type": "string"},
+            }
+        },
+    }
+    rv = []
+    thread = threading.Thread(
+        target=lambda: rv.append(oas.build(oas.load(spec), validate="error")),
+        daemon=True,
+    )
+    thread.start()
+    thread.join(10)
+    assert rv, "build() did not finish"
+    schema = rv[0]["paths"]["/"]["get"]["responses"]["200"]["content"]
+    assert schema["application/json"]["schema"] == {"type": "string"}
+    assert oas.Lazy(lambda: oas.Lazy(lambda: 1)).resolve() == 1
+
+
+def test_validator_import():
+    import subprocess
+    import sys
+
+    # 导入库并创建 namespace 时不导入 openapi-spec-validator 和 asyncio
+    code = (
+        "import sys; from build_openapispec import openapispec; "
+        "oas = openapispec('3.0.3'); "
+        "print('openapi_spec_validator' in sys.modules, 'asyncio' in sys.modules); "
+        "oas.abuild; print('asyncio' in sys.modules)"
+    )
+    output = subprocess.check_output([sys.executable, "-c", code], text=True)
+    assert output.split() == ["False", "False", "True"]
+
+
+def test_custom_validator(oas):
+    import json
+
+    from openapi_spec_validator.validation.exceptions import OpenAPIValidationError
+
+    calls = []
+
+    def validator(spec):
+        calls.append(spec)
+        if "servers" not in spec:
+            yield "servers is required"
+
+    document = _document(oas, oas.SchemaObject({"type": "string"}))
+    with pytest.warns(UserWarning, match="servers is required"):
+        rv = oas.build(document, validator=validator)
+    assert calls == [rv]
+    with pytest.raises(OpenAPIValidationError, match="servers is required"):
+        oas.build(document, validate="error", validator=validator)
+    assert oas.build(document, validate=False, validator=validator) == rv
+    assert len(calls) == 2
+
+    # 其他构建入口接受同样的 validator
+    builds = [
+        lambda doc, **kw: oas.session(doc, **kw).build(),
+        lambda doc, **kw: oas.build_versions(doc, ["3.0.3"], **kw)["3.0.3"],
+        lambda doc, **kw: oas.build_variants(doc, {"all": lambda *a: True}, **kw)[
+            "all"
+        ],
+        lambda doc, **kw: json.loads(oas.build_artifact(doc, **kw).body),
+    ]
+    invalid = _document(oas, oas.SchemaObject({"type": "str"}))
+    for run in builds:
+        with pytest.raises(OpenAPIValidationError, match="servers is required"):
+            run(document, validate="error", validator=validator)
+        assert run(document, validate="error", validator="fast") == rv
+        with pytest.raises(OpenAPIValidationError, match="'type' must be one of"):
+            run(invalid, validate="error", validator="fast")
+
+
+def test_schema_of(oas):
+    import dataclasses
+    import enum
+    import typing as t
+
+    class Color(enum.Enum):
+        RED = "red"
+        BLUE = "blue"
+
+    @dataclasses.dataclass
+    class Node:
+        name: str
+        children: t.List["Node"]
+        color: Color = Color.RED
+        parent: t.Optional["Node"] = None
+
+    class Page(t.TypedDict):
+        items: t.List[Node]
+        total: int
+        tags: t.Dict[str, t.Set[str]]
+
+    schema = oas.schema_of(Page)
+    # 每个类型只生成一次
+    assert oas.schema_of(Page) is schema
+    assert oas.schema_of(Node) is oas.schema_of(Node)
+    assert oas.schema_of(t.List[int]) is oas.schema_of(t.List[int])
+    assert schema.key == "Page" and oas.schema_of(Node).key == "Node"
+
+    rv = oas.build(_document(oas, schema), validate="error")
+    assert rv["components"]["schemas"] == {
+        "Node": {
+            "type": "object",
+            "properties": {
+                "name": {"type": "string"},
+                "children": {
+                    "type": "array",
+                    "items": {"$ref": "#/components/schemas/Node"},
+                },
+                # 只被引用一次的 Color 被内联
+                "color": {
+                    "allOf": [{"type": "string", "enum": ["red", "blue"]}],
+                    "default": "red",
+                },
+                "parent": {
+                    "allOf": [{"$ref": "#/components/schemas/Node"}],
+                    "nullable": True,
+                    "default": None,
+                },
+            },
+            "required": ["name", "children"],
+        }
+    }
+    content = rv["paths"]["/"]["get"]["responses"]["200"]["content"]
+    assert content["application/json"]["schema"] == {
+        "type": "object",
+        "properties": {
+            "items": {"type": "array", "items": {"$ref": "#/components/schemas/Node"}},
+            "total": {"type": "integer"},
+            "tags": {
+                "type": "object",
+                "additionalProperties": {
+                    "type": "array",
+                    "items": {"type": "string"},
+                    "uniqueItems": True,
+                },
+            },
+        },
+        "required": ["items", "total", "tags"],
+    }
+
+    assert oas.schema_of(t.Optional[t.Literal[1, 2]]) == {
+        "type": "integer",
+        "enum": [1, 2],
+        "nullable": True,
+    }
+    with pytest.raises(TypeError):
+        oas.schema_of(complex)
+
+    # 不同的类型不能使用相同的 key
+    def item():
+        @dataclasses.dataclass
+        class Item:
+            name: str
+
+        return Item
+
+    first, second = item(), item()
+    generate = oas.SchemaGenerator()
+    assert generate(first).key == "Item"
+    with pytest.raises(ValueError):
+        generate(t.List[second])
+    generate = oas.SchemaGenerator(key=lambda tp: "%s%d" % (tp.__name__, id(tp)))
+    assert generate(first).key != generate(second).key
+
+
+def test_build_bundle(oas, tmp_path):
+    import json
+
+    pet = oas.SchemaObject({"type": "object"}, key="Pet")
+    scheme = oas.SecuritySchemeObject({"type": "http", "scheme": "bearer"}, key="auth")
+
+    def item(tag):
+        return oas.PathItemObject(
+            {
+                "get": oas.OperationObject(
+                    {
+                        "tags": [tag],
+                        "security": [oas.SecurityRequirementObject(scheme=scheme)],
+                        "responses": {
+                            "200": oas.ResponseObject(
+                                {
+                                    "description": "OK",
+                                    "content": {
+                                        "application/json": oas.MediaTypeObject(
+                                            {"schema": pet}
+                                        )
+                                    },
+                                }
+                            )
+                        },
+                    }
+                )
+            }
+        )
+
+    def document(*paths):
+        return oas.OpenAPIObject(
+            {
+                "info": oas.InfoObject({"title": "title", "version": "1.0"}),
+                "paths": {path: item(tag) for path, tag in paths},
+            }
+        )
+
+    bundle = oas.build_bundle(
+        document(("/pets", "pet"), ("/pets/mine", "pet"), ("/users", "user")),
+        str(tmp_path),
+    )
+    assert sorted(bundle.paths) == ["pet", "user"]
+    assert sorted(bundle.written) == sorted(
+        [bundle.root, bundle.components, *bundle.paths.values()]
+    )
+
+    def read(name):
+        return json.loads((tmp_path / name).read_text())
+
+    root = read(bundle.root)
+    assert root["paths"]["/pets/mine"] == {
+        "$ref": "%s#/~1pets~1mine" % bundle.paths["pet"]
+    }
+    # securitySchemes 留在入口文档中
+    assert root["components"] == {
+        "securitySchemes": {"auth": {"type": "http", "scheme": "bearer"}}
+    }
+    assert read(bundle.components) == {
+        "components": {"schemas": {"Pet": {"type": "object"}}}
+    }
+    content = read(bundle.paths["user"])["/users"]["get"]["responses"]["200"]["content"]
+    assert content["application/json"]["schema"] == {
+        "$ref": "../%s#/components/schemas/Pet" % bundle.components
+    }
+
+    # 只有变化的文件被重写
+    again = oas.build_bundle(
+        document(("/pets", "pet"), ("/pets/mine", "pet"), ("/users", "user")),
+        str(tmp_path),
+    )
+    assert again == bundle._replace(written=[])
+    changed = oas.build_bundle(
+        document(("/pets", "pet"), ("/pets/mine", "pet")), str(tmp_path), prune=True
+    )
+    assert changed.written == [bundle.root]
+    assert sorted(p.name for p in (tmp_path / "paths").iterdir()) == [
+        bundle.paths["pet"][len("paths/") :]
+    ]
+
+
+def test_build_versions(oas):
+    from build_openapispec import openapispec
+
+    pet = oas.SchemaObject(
+        {
+            "type": "object",
+            "properties": {
+                "age": oas.SchemaObject(
+                    {"type": "integer", "minimum": 0, "exclusiveMinimum": True}
+                ),
+                "kind": oas.SchemaObject(
+                    {"type": "string", "enum": ["cat", "dog"], "nullable": True}
+                ),
+                "any": oas.SchemaObject({"nullable": True}),
+            },
+        },
+        key="Pet",
+    )
+    response = oas.ResponseObject(
+        {
+            "description": "OK",
+            "content": {"application/json": oas.MediaTypeObject({"schema": pet})},
+        }
+    )
+    document = oas.OpenAPIObject(
+        {
+            "info": oas.InfoObject({"title": "title", "version": "1.0"}),
+            "paths": {
+                path: oas.PathItemObject(
+                    {"get": oas.OperationObject({"responses": {"200": response}})}
+                )
+                for path in ("/a", "/b")
+            },
+        }
+    )
+
+    rv = oas.build_versions(document, ["3.0.3", "3.1.0"], validate="error")
+    assert rv["3.0.3"] == oas.build(document)
+    assert rv["3.1.0"] == openapispec("3.1.0").build(document, validate="error")
+    assert rv["3.1.0"]["openapi"] == "3.1.0"
+    assert rv["3.1.0"]["components"]["schemas"]["Pet"]["properties"] == {
+        "age": {"type": "integer", "exclusiveMinimum": 0},
+        "kind": {"type": ["string", "null"], "enum": ["cat", "dog", None]},
+        "any": {"anyOf": [{}, {"type": "null"}]},
+    }
+    # 与版本无关的部分在各版本之间共享
+    assert rv["3.0.3"]["paths"]["/a"] is rv["3.1.0"]["paths"]["/a"]
+
+    # 3.1 文档加载后再构建得到相同的结果
+    oas31 = openapispec("3.1.0")
+    assert oas31.build(oas31.load(rv["3.1.0"])) == rv["3.1.0"]
+
+
+def test_build_versions_plain_schemas(oas):
+    import json
+
+    from build_openapispec import openapispec
+
+    # schema 位置上的普通 dict 同样按目标版本转换
+    age = {"type": "integer", "minimum": 0, "exclusiveMinimum": True}
+    pet = oas.SchemaObject(
+        {
+            "type": "object",
+            "properties": {"age": age, "tags": {"items": {"nullable": True}}},
+        },
+        key="Pet",
+    )
+    operation = {
+        "parameters": [{"name": "age", "in": "query", "schema": dict(age)}],
+        "responses": {
+            "200": {
+                "description": "OK",
+                "content": {"application/json": {"schema": pet}},
+            }
+        },
+    }
+    document = oas.OpenAPIObject(
+        {
+            "info": oas.InfoObject({"title": "title", "version": "1.0"}),
+            "paths": {"/a": {"get": operation}, "/b": {"get": operation}},
+        }
+    )
+
+    oas31 = openapispec("3.1.0")
+    rv = oas31.build(document, validate="error")
+    assert rv["components"]["schemas"]["Pet"]["properties"] == {
+        "age": {"type": "integer", "exclusiveMinimum": 0},
+        "tags": {"items": {"anyOf": [{}, {"type": "null"}]}},
+    }
+    assert rv["paths"]["/a"]["get"]["parameters"][0]["schema"] == {
+        "type": "integer",
+        "exclusiveMinimum": 0,
+    }
+    # 不在 schema 位置上的同名字段保持不变
+    assert rv["paths"]["/a"]["get"]["parameters"][0]["name"] == "age"
+
+    assert oas.build_versions(document, ["3.0.3", "3.1.0"])["3.1.0"] == rv
+    assert json.loads("".join(oas31.iterbuild(document))) == rv
+    assert oas31.session(document).build() == rv
+
+
+def test_interner(oas):
+    import json
+
+    pet = oas.SchemaObject({"type": "object", "properties": {}}, key="Pet")
+
+    def document(description):
+        return oas.OpenAPIObject(
+            {
+                "info": oas.InfoObject({"title": "title", "version": "1.0"}),
+                "paths": {
+                    path: oas.PathItemObject(
+                        {
+                            "get": oas.OperationObject(
+                                {
+                                    "responses": {
+                                        "200": oas.ResponseObject(
+                                            {
+                                                "description": description,
+                                                "content": {
+                                                    "application/json": oas.MediaTypeObject(
+                                                        {"schema": pet}
+                                                    )
+                                                },
+                                            }
+                                        )
+                                    },
+                                    "x-values": [1, True, 1.0, 0.0, -0.0],
+                                }
+                            )
+                        }
+                    )
+                    for path in ("/a", "/b")
+                },
+            }
+        )
+
+    interner = oas.Interner()
+    a = oas.build(document("OK"), interner=interner)
+    # 可以直接用 json 序列化，list 转为 tuple
+    assert json.loads(json.dumps(a)) == oas.build(document("OK"))
+    with pytest.raises(TypeError):
+        a["paths"]["/a"]["x"] = 1
+
+    # 内容相同的子树是同一个对象
+    assert a["paths"]["/a"] is a["paths"]["/b"]
+    values = a["paths"]["/a"]["get"]["x-values"]
+    assert values == (1, True, 1.0, 0.0, -0.0)
+    assert [type(v) for v in values] == [int, bool, float, float, float]
+    assert json.dumps(values) == "[1, true, 1.0, 0.0, -0.0]"
+
+    # 多次构建之间共享没有变化的部分
+    b = oas.build(document("Changed"), interner=interner)
+    assert b["components"] is a["components"]
+    assert b["paths"]["/a"] is not a["paths"]["/a"]
+    assert oas.build(document("OK"), interner=interner) is a
+    assert interner(a) is a
+
+    interner.clear()
+    assert len(interner) == 0
+    assert oas.build(document("OK"), interner=interner) is not a